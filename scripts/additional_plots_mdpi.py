@@ -1,20 +1,33 @@
 #!/bin/python
+import argparse
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
+from results_store import ResultsStore
 
 BLUE = "#0072BD"
 GREEN = "#77AC30"
 
-number_of_beacons = [3, 4, 5, 6]
+parser = argparse.ArgumentParser(description="Plots the influence of the number and the subset of beacons for the MDPI paper")
+parser.add_argument("-r", "--run", default=None, help="Id of the run of compute_results.py (default: the latest)")
+args = parser.parse_args()
 
-rssi_avg = [2.239,2.111,2.069,2.037]
-rssi_var = [1.373,1.397,1.356,1.350]
-rssi_std = [1.167,1.178,1.160,1.162]
+# Statistics of wkNN with k=3 and the Euclidian norm, per beacon subset
+results = ResultsStore()
+aggregates = results.query("aggregates", run=args.run or results.latest_run(), k=3, metric="EUCLID")
+rssi = aggregates[aggregates["method"] == "RSSI"]
+mcpd = aggregates[aggregates["method"] == "MCPD"]
 
-mcpd_avg = [0.696,0.610, 0.539,0.579]
-mcpd_var = [0.129,0.050, 0.027,0.020]
-mcpd_std = [0.311,0.204,0.158, 0.143]
+number_of_beacons = sorted(aggregates["n_beacons"].unique().tolist())
+
+# Averaged over all subsets with the same number of beacons
+rssi_avg = rssi.groupby("n_beacons")["avg"].mean().tolist()
+rssi_var = rssi.groupby("n_beacons")["var"].mean().tolist()
+rssi_std = rssi.groupby("n_beacons")["std"].mean().tolist()
+
+mcpd_avg = mcpd.groupby("n_beacons")["avg"].mean().tolist()
+mcpd_var = mcpd.groupby("n_beacons")["var"].mean().tolist()
+mcpd_std = mcpd.groupby("n_beacons")["std"].mean().tolist()
 
 plt.rc('text', usetex=True)
 plt.rcParams.update({
@@ -33,16 +46,17 @@ plt.xlabel('Number of beacons')
 plt.ylabel('Statistics in m')
 plt.title("\\textbf{{Influence of number of beacons}}", y=1.2)
 plt.subplots_adjust(top=0.75)
-plt.xticks([3,4,5,6])
+plt.xticks(number_of_beacons)
 plt.ylim(0,2.5)
 plt.savefig("../figures/infl_num_beac.svg", bbox_inches='tight')
 plt.show()
 
-rssi_3b = [2.460,2.445,2.504,1.800,2.362,2.542,1.987,2.599,2.203,2.284,2.349,2.157,1.726,2.523,2.112,1.955,2.475,1.973,1.922,2.399]
+# Average error of each subset of three beacons
+rssi_3b = rssi.loc[rssi["n_beacons"] == 3, "avg"].tolist()
 print("RSSI 3B difference:")
 print(100*(1-min(rssi_3b)/max(rssi_3b)))
 
-mcpd_3b = [0.695,0.554,1.067,0.707,0.503,0.572,0.796,0.771,0.617,0.581,0.601,0.720,0.523,0.934,0.652,0.828,0.580,0.610,0.866,0.748]
+mcpd_3b = mcpd.loc[mcpd["n_beacons"] == 3, "avg"].tolist()
 print("MCPD 3B difference:")
 print(100*(1-min(mcpd_3b)/max(mcpd_3b)))
 
@@ -0,0 +1,155 @@
+#!/bin/python
+from typing import Dict, List, Optional
+import argparse
+import os
+import time
+import numpy as np
+import configs
+from configs import Site, describe_site, parse_site
+from dataset import file_hash, map_column, read_header, write_columns
+from fingerprint import Fingerprint
+
+MAGIC = b"WKNNFPR\x01"
+# Version of the layout, files of another version have to be built again
+VERSION = 2
+# Arrays of a fingerprint artifact, in storage order. The variances are optional
+ARRAYS = [
+    ("positions", "<i8"),
+    ("beacon_ids", "<i8"),
+    ("rssi", "<f8"),
+    ("mcpd", "<f8"),
+    ("rssi_var", "<f8"),
+    ("mcpd_var", "<f8"),
+    ("coordinates", "<f8"),
+]
+
+
+def write_artifact(path: str, reference: Fingerprint, site: Site, sources: List[str] = ()):
+    """Compiles a fingerprint and the site model into a single binary file
+
+    Layout of dataset.write_columns. The header holds the version, the site
+    description, the map of beacon numbers onto columns and the hashes of the
+    source files, so a stale artifact can be detected.
+
+    :param path: file to write, replaced atomically
+    :param reference: Fingerprint of the train positions
+    :param site: Site the fingerprint belongs to
+    :param sources: files the fingerprint and the site were built from
+
+    """
+    coordinates = reference.coordinates
+    if coordinates is None:
+        coordinates = np.array([[site.train_points[p].x, site.train_points[p].y] for p in reference.positions.tolist()]).reshape(-1, 2)
+    values = {
+        "positions": reference.positions,
+        "beacon_ids": reference.beacon_ids,
+        "rssi": reference.rssi,
+        "mcpd": reference.mcpd,
+        "rssi_var": reference.rssi_var,
+        "mcpd_var": reference.mcpd_var,
+        "coordinates": coordinates,
+    }
+    arrays = {name: np.asarray(values[name], dtype=dtype) for name, dtype in ARRAYS if values[name] is not None}
+    header = {
+        "version": VERSION,
+        "metadata": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "sources": {source: file_hash(source) for source in sources},
+        },
+        "site": describe_site(site),
+        "beacon_index": {str(int(n)): i for i, n in enumerate(reference.beacon_ids.tolist())},
+    }
+    write_columns(path, arrays, header, MAGIC)
+
+
+def build_artifact(path: str = None, store=None, site: Site = None) -> str:
+    """Builds the artifact from the average train data and the site model
+
+    :param path: file to write, defaults to configs.artifact_path
+    :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+    :param site: Site, defaults to configs.site
+    :returns: path of the artifact
+
+    """
+    # Only the build needs pandas
+    from reference_store import default_store
+    path = path or configs.artifact_path
+    store = store or default_store
+    sources = ["{}results_avg.csv".format(store.train_set_path)]
+    if site is None:
+        site = configs.site
+        sources.append(configs.site_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_artifact(path, store.fingerprint(), site, sources)
+    return path
+
+
+class FingerprintArtifact:
+    """Read-only view of a file written by write_artifact
+
+    Opening reads the header only. The arrays are memory-mapped and the
+    Fingerprint and Site are built on first use, so only numpy is needed and a
+    restarted process can serve estimates right away.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: file to read, defaults to configs.artifact_path
+
+        """
+        path = path or configs.artifact_path
+        header = read_header(path, MAGIC, "fingerprint artifact")
+        if header["version"] != VERSION:
+            raise ValueError("{} has version {}, expected {}: run artifact.py again".format(path, header["version"], VERSION))
+        self.path = path
+        self.metadata: Dict[str, object] = header["metadata"]
+        # beacon number (Beacon.n) -> column of the fingerprint matrices
+        self.beacon_index: Dict[int, int] = {int(n): i for n, i in header["beacon_index"].items()}
+        self._description = header["site"]
+        self._arrays = {entry["name"]: entry for entry in header["columns"]}
+        self._site: Optional[Site] = None
+        self._fingerprint: Optional[Fingerprint] = None
+
+    def array(self, name: str) -> Optional[np.ndarray]:
+        """Memory-mapped array of the artifact, None if it was not stored"""
+        entry = self._arrays.get(name)
+        if entry is None:
+            return None
+        return map_column(self.path, entry)
+
+    @property
+    def site(self) -> Site:
+        if self._site is None:
+            self._site = parse_site(self._description)
+        return self._site
+
+    def fingerprint(self) -> Fingerprint:
+        """Returns the fingerprint of the train positions, with the coordinates of the positions"""
+        if self._fingerprint is None:
+            self._fingerprint = Fingerprint(*(self.array(name) for name, _ in ARRAYS))
+        return self._fingerprint
+
+    def stale(self) -> List[str]:
+        """Lists the source files that changed or disappeared since the artifact was built"""
+        return [
+            source for source, digest in self.metadata["sources"].items()
+            if not os.path.exists(source) or file_hash(source) != digest
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the site model and the train fingerprint into one binary file for the online estimation")
+    parser.add_argument("-o", "--output", default=configs.artifact_path, help="Artifact to write (or check)")
+    parser.add_argument("--check", action="store_true", help="Only report whether the artifact is older than its sources")
+    args = parser.parse_args()
+
+    if not args.check:
+        build_artifact(args.output)
+    artifact = FingerprintArtifact(args.output)
+    reference = artifact.fingerprint()
+    print("{}: version {}, built {}, {} positions, {} beacons, {} rooms".format(
+        artifact.path, VERSION, artifact.metadata["created"], len(reference.positions), len(artifact.beacon_index), len(artifact.site.rooms)))
+    stale = artifact.stale()
+    if stale:
+        print("Stale, changed sources: {}".format(", ".join(stale)))
+        raise SystemExit(1)
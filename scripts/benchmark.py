@@ -0,0 +1,339 @@
+#!/bin/python
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pytablewriter import MarkdownTableWriter
+import configs
+from artifact import FingerprintArtifact, build_artifact
+from configs import Beacon, Point, Room, Site
+from fingerprint import Fingerprint
+from online import OnlineLocalizer
+from reference_store import ReferenceStore
+from wknn import Metric, get_norm, get_estimation_point, get_estimation_point_from_average, get_estimation_batch, get_estimation_fused
+import test_validation_split
+
+# name: (train positions, beacons, validation positions, samples per position and beacon)
+SIZES = {
+    "room": (9, 6, 5, 150),
+    "hall": (400, 12, 20, 120),
+    "building": (2500, 16, 50, 110),
+}
+
+# name: (reference positions, beacons, queries), searched without the evaluation pipeline
+RADIO_MAPS = {
+    "radio_map": (10000, 16, 200),
+}
+# Clusters probed per query by the coarse-to-fine search
+PROBES = [1, 3, 10]
+
+BASELINE = "../benchmarks/baseline.json"
+
+# Run in a new interpreter: imports, loads an artifact and estimates once
+COLD_START = """
+from artifact import FingerprintArtifact
+from online import OnlineLocalizer
+from wknn import Metric
+artifact = FingerprintArtifact({!r})
+beacons = artifact.site.beacons
+OnlineLocalizer(3, Metric.EUCLID, artifact=artifact).reference.estimate(3, Metric.EUCLID, {{b.n: -60.0 for b in beacons}}, {{b.n: 3.0 for b in beacons}})
+"""
+
+
+@dataclass
+class Measurement:
+    size: str
+    case: str
+    calls: int
+    estimates: int
+    # Estimates per second
+    throughput: float
+    # Latency of a single call, in milliseconds
+    p50: float
+    p90: float
+    p99: float
+    # Peak of the memory allocated during one call, in MiB
+    peak_memory: float
+    # Approximate searches only: share of the exact k closest found, and growth of the mean error in m
+    recall: float = float("nan")
+    error_increase: float = float("nan")
+
+
+def synthetic_room(positions: int, beacons: int, validation: int, rng) -> Room:
+    """Creates a room with a grid of train positions and beacons spread along its walls
+
+    :param positions: number of train positions
+    :param beacons: number of beacons
+    :param validation: number of validation positions
+    :param rng: numpy random Generator
+    :returns: Room
+
+    """
+    cols = math.ceil(math.sqrt(positions))
+    rows = math.ceil(positions / cols)
+    # 1.5 m between two train positions, 1 m to the walls
+    size = Point(x=1.5 * (cols - 1) + 2, y=1.5 * (rows - 1) + 2)
+    train_points = {i + 1: Point(x=1 + 1.5 * (i % cols), y=1 + 1.5 * (i // cols)) for i in range(positions)}
+    validation_points = {
+        positions + i + 1: Point(x=float(rng.uniform(1, size.x - 1)), y=float(rng.uniform(1, size.y - 1)))
+        for i in range(validation)
+    }
+    perimeter = 2 * (size.x + size.y)
+    room_beacons = []
+    for i in range(beacons):
+        d = perimeter * i / beacons
+        if d < size.x:
+            position = Point(x=d, y=0)
+        elif d < size.x + size.y:
+            position = Point(x=size.x, y=d - size.x)
+        elif d < 2 * size.x + size.y:
+            position = Point(x=2 * size.x + size.y - d, y=size.y)
+        else:
+            position = Point(x=0, y=perimeter - d)
+        uuid = ":".join("{:02X}".format(v) for v in (0xC0, 0xFF, 0xEE, 0x00, i // 256, i % 256))
+        room_beacons.append(Beacon(uuid=uuid, n=i + 1, position=position))
+    return Room(beacons=room_beacons, size=size, train_points=train_points, validation_points=validation_points)
+
+
+def synthetic_raw_data(room: Room, point: Point, samples: int, rng) -> pd.DataFrame:
+    """Simulates the scanner output at one position, using a log-distance path loss model for RSSI
+
+    :returns: A Dataframe with the configs.uart_columns, samples rows per beacon, interleaved like the scanner output
+
+    """
+    frames = []
+    for b in room.beacons:
+        d = max(point.euc_distance(b.position), 0.1)
+        mcpd = np.abs(d + rng.normal(0, 0.3, samples)).round(2)
+        frames.append(pd.DataFrame({
+            "uuid": b.uuid,
+            "state": "ok",
+            "rssi": np.round(-45 - 20 * np.log10(d) + rng.normal(0, 4, samples)).astype(int),
+            "mcpd_ifft": mcpd,
+            "mcpd_phase_slope": np.abs(d + rng.normal(0, 1.0, samples)).round(2),
+            "mcpd_rssi_openspace": np.abs(1.5 * d + rng.normal(0, 2.0, samples)).round(2),
+            "best": mcpd,
+            "order": np.arange(samples),
+        }))
+    return pd.concat(frames).sort_values("order", kind="stable").drop(columns="order")[configs.uart_columns]
+
+
+@contextmanager
+def synthetic_site(size: str, directory: str, seed: int = 0):
+    """Writes the raw data of a synthetic room and points configs at it for the duration of the context"""
+    (positions, beacons, validation, samples) = SIZES[size]
+    rng = np.random.default_rng(seed)
+    room = synthetic_room(positions, beacons, validation, rng)
+    paths = {
+        "raw_data_path": os.path.join(directory, "raw_data", ""),
+        "train_set_path": os.path.join(directory, "train_set", ""),
+        "test_set_path": os.path.join(directory, "test_set", ""),
+        "validation_set_path": os.path.join(directory, "validation_set", ""),
+        "quarantine_path": os.path.join(directory, "quarantine", ""),
+    }
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+    paths["split_manifest_path"] = os.path.join(directory, "split_manifest.json")
+    for p, point in itertools.chain(room.train_points.items(), room.validation_points.items()):
+        synthetic_raw_data(room, point, samples, rng).to_csv("{}{}.csv".format(paths["raw_data_path"], p), header=False, index=False)
+
+    original = {name: getattr(configs, name) for name in ["site", "room", *paths]}
+    try:
+        configs.site = Site(rooms={size: room})
+        configs.room = room
+        for name, path in paths.items():
+            setattr(configs, name, path)
+        yield room
+    finally:
+        for name, value in original.items():
+            setattr(configs, name, value)
+
+
+def measure(size: str, case: str, fn: Callable[[], object], calls: int, estimates_per_call: int, warmup: bool = True) -> Measurement:
+    """Runs fn calls times, then once more to trace its peak memory"""
+    if warmup:
+        # Fill caches and resolve lazy imports
+        fn()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies = np.array(latencies) * 1000
+    return Measurement(
+        size=size,
+        case=case,
+        calls=calls,
+        estimates=estimates_per_call,
+        throughput=float(calls * estimates_per_call / (latencies.sum() / 1000)),
+        p50=float(np.percentile(latencies, 50)),
+        p90=float(np.percentile(latencies, 90)),
+        p99=float(np.percentile(latencies, 99)),
+        peak_memory=peak / 2**20,
+    )
+
+
+def benchmark(size: str, calls: int, max_subsets: int, split: bool) -> List[Measurement]:
+    """Runs all benchmark cases on one synthetic site"""
+    measurements = []
+    with tempfile.TemporaryDirectory() as directory, synthetic_site(size, directory) as room:
+        if split:
+            measurements.append(measure(size, "test_validation_split", lambda: test_validation_split.main(force=True), 1, 0, warmup=False))
+        else:
+            test_validation_split.main()
+
+        store = ReferenceStore()
+        beacons = room.beacons
+        train = list(room.train_points)
+        validation = list(room.validation_points)
+        reference = store.train
+        measurement = store.measurement(validation[0])
+
+        measurements.append(measure(size, "get_norm", lambda: get_norm(measurement, reference, beacons, Metric.EUCLID), calls, 1))
+        measurements.append(measure(size, "get_estimation_point", lambda: get_estimation_point(3, validation[0], beacons, Metric.EUCLID, measurement, store), calls, 1))
+        measurements.append(measure(size, "get_estimation_point_from_average", lambda: get_estimation_point_from_average(3, train[0], beacons, Metric.CHEBYSHEV, store), calls, 1))
+
+        import compute_results
+        samples = compute_results.load_validation_samples(beacons)
+        queries = np.concatenate(list(samples.values()))
+        points = np.concatenate([[p] * len(s) for p, s in samples.items()])
+        measurements.append(measure(size, "get_estimation_batch", lambda: get_estimation_batch(3, points, beacons, Metric.EUCLID, queries[..., 0], queries[..., 1], store=store), calls, len(points)))
+        measurements.append(measure(size, "get_estimation_fused", lambda: get_estimation_fused(3, points, beacons, Metric.EUCLID, queries, store=store), calls, len(points)))
+
+        # Start of the online estimation, parsing results_avg.csv or mapping the compiled artifact
+        path = build_artifact(os.path.join(directory, "fingerprint.wkfp"), store, configs.site)
+        measurements.append(measure(size, "online start (results_avg.csv)", lambda: OnlineLocalizer(3, Metric.EUCLID, store=ReferenceStore()), calls, 1))
+        measurements.append(measure(size, "online start (artifact)", lambda: OnlineLocalizer(3, Metric.EUCLID, artifact=FingerprintArtifact(path)), calls, 1))
+        cold_start = lambda: subprocess.run([sys.executable, "-c", COLD_START.format(path)], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        measurements.append(measure(size, "online cold start (artifact)", cold_start, min(calls, 10), 1))
+
+        # Sweep over the beacon subsets, without the plots and tables
+        compute_results.init_worker(store, samples)
+        subsets = [c for i in range(3, len(beacons) + 1) for c in itertools.combinations(beacons, i)][:max_subsets]
+        estimates = len(subsets) * 2 * len(compute_results.METRICS) * (len(train) + len(points))
+        measurements.append(measure(size, "compute_results sweep", lambda: compute_results.evaluate_chunk(subsets), 1, estimates, warmup=False))
+    return measurements
+
+
+@contextmanager
+def patched_site(room: Room):
+    """Points configs at a room for the duration of the context, without writing any data"""
+    original = (configs.site, configs.room)
+    try:
+        configs.site = Site(rooms={"synthetic": room})
+        configs.room = room
+        yield room
+    finally:
+        (configs.site, configs.room) = original
+
+
+def benchmark_search(name: str, calls: int, probes: List[int]) -> List[Measurement]:
+    """Compares the coarse-to-fine search against the exact search on a large synthetic radio map"""
+    (positions, beacons, queries) = RADIO_MAPS[name]
+    rng = np.random.default_rng(0)
+    room = synthetic_room(positions, beacons, queries, rng)
+    coordinates = np.array([[p.x, p.y] for p in room.train_points.values()])
+    beacon_positions = np.array([[b.position.x, b.position.y] for b in room.beacons])
+
+    def radio(points, noise):
+        d = np.maximum(np.linalg.norm(points[:, None, :] - beacon_positions, axis=-1), 0.1)
+        rssi = -45 - 20 * np.log10(d) + rng.normal(0, noise, d.shape)
+        mcpd = np.abs(d + rng.normal(0, noise / 10, d.shape))
+        return (rssi, mcpd)
+
+    (rssi, mcpd) = radio(coordinates, 1)
+    reference = Fingerprint(list(room.train_points), [b.n for b in room.beacons], rssi, mcpd, coordinates=coordinates)
+    points = np.array(list(room.validation_points))
+    (rssi_q, mcpd_q) = radio(np.array([[p.x, p.y] for p in room.validation_points.values()]), 3)
+
+    measurements = []
+    with patched_site(room):
+        estimate = lambda backend, **options: get_estimation_batch(3, points, room.beacons, Metric.EUCLID, rssi_q, mcpd_q, reference=reference, backend=backend, search_options=options)
+        exact = estimate("brute")
+        measurements.append(measure(name, "exact search", lambda: estimate("brute"), calls, len(points)))
+        for p in probes:
+            approximate = estimate("clustered", probes=p)
+            m = measure(name, "clustered search, {} probes".format(p), lambda: estimate("clustered", probes=p), calls, len(points))
+            found = [
+                len(set(a) & set(e)) / len(e)
+                for closest in ["rssi_k_closest", "mcpd_k_closest"]
+                for a, e in zip(getattr(approximate, closest).tolist(), getattr(exact, closest).tolist())
+            ]
+            m.recall = float(np.mean(found))
+            m.error_increase = float(np.mean(np.r_[approximate.rssi_euc_error - exact.rssi_euc_error, approximate.mcpd_euc_error - exact.mcpd_euc_error]))
+            measurements.append(m)
+    return measurements
+
+
+def compare(measurements: List[Measurement], baseline: Dict[str, Dict[str, dict]], tolerance: float) -> List[str]:
+    """Lists the cases whose median latency grew by more than tolerance compared to the baseline"""
+    regressions = []
+    for m in measurements:
+        reference = baseline.get(m.size, {}).get(m.case)
+        if reference and m.p50 > reference["p50"] * (1 + tolerance):
+            regressions.append("{} / {}: p50 {:.3f} ms, baseline {:.3f} ms".format(m.size, m.case, m.p50, reference["p50"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the wkNN estimator and the evaluation pipeline on synthetic data")
+    parser.add_argument("sizes", nargs="*", default=["room", "hall"], help="Synthetic sites to run: {}".format(", ".join(SIZES)))
+    parser.add_argument("--radio-maps", nargs="*", default=list(RADIO_MAPS), choices=list(RADIO_MAPS), help="Synthetic radio maps to run the search comparison on")
+    parser.add_argument("--probes", type=int, nargs="*", default=PROBES, help="Clusters probed per query by the coarse-to-fine search")
+    parser.add_argument("-n", "--calls", type=int, default=100, help="Timed calls per case")
+    parser.add_argument("--max-subsets", type=int, default=20, help="Beacon subsets evaluated by the sweep case")
+    parser.add_argument("--no-split", action="store_true", help="Do not time test_validation_split.py")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative growth of the median latency before reporting a regression")
+    args = parser.parse_args()
+    # argparse would check the default list as a whole against choices, so the sizes are checked here
+    for size in args.sizes:
+        if size not in SIZES:
+            parser.error("argument sizes: invalid choice: '{}' (choose from {})".format(size, ", ".join(SIZES)))
+
+    measurements = []
+    for size in args.sizes:
+        measurements += benchmark(size, args.calls, args.max_subsets, not args.no_split)
+    for name in args.radio_maps:
+        measurements += benchmark_search(name, args.calls, args.probes)
+
+    df = pd.DataFrame([asdict(m) for m in measurements]).round(decimals=3)
+    writer = MarkdownTableWriter(table_name="benchmark", margin=1)
+    writer.from_dataframe(df, add_index_column=False)
+    print(writer.dumps())
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for m in measurements:
+            baseline.setdefault(m.size, {})[m.case] = asdict(m)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print("Baseline stored in {}".format(args.baseline))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(measurements, json.load(f), args.tolerance)
+        if regressions:
+            print("# Regressions")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("No regressions compared to {}".format(args.baseline))
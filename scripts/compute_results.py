@@ -1,263 +1,265 @@
 #!/bin/python
 
-from datetime import time
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import configs
-from wknn import Metric, get_estimation_point, Result, get_estimation_point_from_average
-from pytablewriter import MarkdownTableWriter
+from wknn import Metric, BatchResult, get_estimation_batch, measurement_vectors
+from reference_store import ReferenceStore, default_store
+from dataset import load_dataset
+from distance_cache import DistanceCache
+from results_store import ResultsStore, beacon_key, new_run_id
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import itertools
-from pytablewriter.style import Style
-import matplotlib.pyplot as plt
-from math import ceil
-import seaborn as sns
 import pandas as pd
-import itertools
 from collections import defaultdict
 import numpy as np
 
-def plot_beautify(k, metric, method: str):
-    LIMIT_TOL = 0.5
-    limits = (configs.room.size.x, configs.room.size.y)
-
-    beacons = ([beacon.position.x for beacon in configs.room.beacons],[beacon.position.y for beacon in configs.room.beacons])
-    train = ([position.x for position in configs.room.train_points.values()],[position.y for position in configs.room.train_points.values()])
-
-    plt.figure(figsize=[configs.room.size.x*0.7, configs.room.size.y*0.7])
-    plt.rc('text', usetex=True)
-    plt.rcParams.update({
-        'mathtext.fontset': 'stix',
-        'font.family': 'STIXGeneral',
-        'font.size'   : 12,
-    })
-    plt.scatter(beacons[0], beacons[1], [75 for x in beacons[0]], marker='^', color='k')
-    plt.scatter(train[0], train[1], [75 for x in train[0]], marker='s', color=(0.5, 0.5, 0.5))
-    plt.xlim(0-LIMIT_TOL, limits[0]+LIMIT_TOL)
-    plt.ylim(0-LIMIT_TOL, limits[1]+LIMIT_TOL)
-    plt.xlabel("x-Coordinate in m")
-    plt.ylabel("y-Coordinate in m")
-
-    if metric == Metric.CHEBYSHEV:
-        metric = "\\infty"
-    else:
-        metric = "2"
-
-    if k == 0:
-        plt.title("\\textbf{{Room setup}}", y=1.1)
-    else:
-        plt.title("\\textbf{{{}-Results for wkNN with $k={}$, $||\\cdot||_{}$}}".format(method, k, metric), y=1.1)
-    plt.tight_layout()
-
-def plot_store(k, metric, method):
-    if k == 0:
-        plt.legend(["Beacons","Train Pos.","Reference"], scatteryoffsets=[0.5,0.5,0.5], bbox_to_anchor=(0.5,1.1), ncol=3, columnspacing=0.5, handletextpad=-0.2, loc='upper center')
-        leg = plt.gca().get_legend()
-        leg.legendHandles[2].set_edgecolor('k')
-        leg.legendHandles[2].set_facecolor('#FFFFFF')
-        plt.savefig("../figures/room_setup.svg")
-        #plt.show()
-        plt.close('all')
-    else:
-        plt.legend(["Beacons","Train Pos.","Ref.","Est.", "Avg. Est."], scatteryoffsets=[0.5,0.5,0.5,0.5,0.5], bbox_to_anchor=(0.5,1.1), ncol=5, columnspacing=0.4, handletextpad=-0.3, loc='upper center')
-        leg = plt.gca().get_legend()
-        for i in range(2,5):
-            leg.legendHandles[i].set_edgecolor('k')
-            leg.legendHandles[i].set_facecolor('#FFFFFF')
-        plt.savefig("../figures/k{}_{}_{}.svg".format(k, str(metric).lower(), method.lower()))
-        #plt.show()
-        plt.close('all')
-
-def histogram_boxplot(data, k, metric, method: str, xlim: List = [], bins = None):
-    sns.set_theme()
-    sns.set_style("whitegrid")
-    sns.set_style({'mathtext.fontset': 'stix',
-        'font.family': 'STIXGeneral',
-        'font.size': 12,
-        'axes.edgecolor': 'black',
-        'axes.linewidth': 1})
-    sns.set_context(font_scale=2)
-    f, (ax_box, ax_hist) = plt.subplots(2, gridspec_kw={"height_ratios": (.15, .85)})
-    sns.boxplot(data, ax=ax_box, orient='h')
-    sns.histplot(data, ax=ax_hist, bins=bins, kde=True) if bins else sns.histplot(data, ax=ax_hist, kde=True, stat='density')
-    ax_box.set(yticks=[], xticks=[])
-    ax_hist.set(xlabel="Estimation error in m")
-    if len(xlim) != 0: ax_hist.set(xlim=xlim)
-    if len(xlim) != 0: ax_box.set(xlim=xlim)
-
-    if metric == Metric.CHEBYSHEV:
-        tit_metric = "\\infty"
-    else:
-        tit_metric = "2"
-    plt.suptitle("\\textbf{{{}-Error for wkNN with $k={}$, $||\\cdot||_{}$}}".format(method, k, tit_metric), y=0.95)
-    plt.tight_layout()
-    plt.savefig("../figures/hist_k{}_{}_{}.svg".format(k, str(metric).lower(), method.lower()))
-    #plt.show()
-    plt.close('all')
-
-        
-
-
-combinations = []
-all_results: Dict[int, Dict[int, Dict[Metric, Dict[str, List[float]]]]] = defaultdict(dict)
-for i in range(3, len(configs.room.beacons)+1):
-    combinations += list(itertools.combinations(configs.room.beacons, i))
-    # Create empty all_results dict
-    all_results[i] = dict()
-    for k in [3, 5]:
-        all_results[i][k] = dict()
-        for metric in [Metric.EUCLID, Metric.CHEBYSHEV]:
-            all_results[i][k][metric] = dict()
-            for method in ["RSSI", "MCPD"]:
-                all_results[i][k][metric][method] = dict()
-                all_results[i][k][metric][method]["var"] = []
-                all_results[i][k][metric][method]["std"] = []
-                all_results[i][k][metric][method]["avg"] = []
-                all_results[i][k][metric][method]["max"] = []
-                all_results[i][k][metric][method]["min"] = []
-                
-
-    
-for b in combinations:
-    beacons = list(b)
-    print("# Beacons: " + str(list(map(lambda b: b.n, beacons))))
-    # Dict[k][metric][point] = List[Result]
-    results: Dict[int, Dict[Metric, Dict[int, List[Result]]]] = {}
+# Metrics compared by the sweep
+METRICS = [Metric.CHEBYSHEV, Metric.EUCLID]
+
+# Shared with the worker processes: set once per worker by init_worker, never pickled per task
+store: ReferenceStore = default_store
+validation_samples: Dict[int, np.ndarray] = {}
+# Average measurement of every point over all room beacons, (rssi, mcpd), read from the store once per worker
+average_vectors: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+# Distances of the measurements per beacon subset and metric, reused for all k
+cache: DistanceCache = DistanceCache(store)
+
+
+def load_validation_samples(beacons) -> Dict[int, np.ndarray]:
+    """Loads the single measurements of all validation positions
+
+    :param beacons: List of Beacon to load
+    :returns: Dict[point] = array (samples x beacons x [rssi, mcpd_ifft])
+
+    """
+    dataset = load_dataset("{}{}".format(configs.validation_set_path, configs.dataset_filename))
+    return {p: dataset.stack(p, beacons) for p in configs.room.validation_points}
+
+
+def init_worker(shared_store: ReferenceStore, shared_validation_samples: Dict[int, np.ndarray]):
+    """Initializer of the worker processes, receives the reference data once per worker"""
+    global store, validation_samples, average_vectors, cache
+    store = shared_store
+    validation_samples = shared_validation_samples
+    average_vectors = {}
+    cache = DistanceCache(store)
+
+
+def average_measurements() -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Average measurement vectors of all train and validation points, in the order of the room beacons"""
+    if not average_vectors:
+        for p in itertools.chain(configs.room.train_points, configs.room.validation_points):
+            (rssi_m, mcpd_m) = measurement_vectors(store.measurement(p), configs.room.beacons)
+            average_vectors[p] = (np.asarray(rssi_m, dtype=float), np.asarray(mcpd_m, dtype=float))
+    return average_vectors
+
+
+def prefill(subsets):
+    """Computes the distances of all measurements for a chunk of beacon subsets at once
+
+    The per-beacon differences are shared by all subsets (see Fingerprint.subset_norms),
+    evaluate_combination then finds every distance it needs in the cache.
+
+    :param subsets: List of subsets (lists of Beacon) of the room beacons
+
+    """
+    beacons = configs.room.beacons
+    # Two metrics, the average of every point and the samples of every validation point per subset
+    entries = len(subsets) * len(METRICS) * (len(configs.room.train_points) + 2 * len(configs.room.validation_points))
+    cache.maxsize = max(cache.maxsize, entries)
+    for metric in METRICS:
+        for p, (rssi_m, mcpd_m) in average_measurements().items():
+            cache.fill(("average", p), beacons, subsets, metric, rssi_m, mcpd_m)
+        for p in configs.room.validation_points:
+            samples = validation_samples[p]
+            cache.fill(("validation", p), beacons, subsets, metric, samples[..., 0], samples[..., 1])
+
+
+def estimate_average(k: int, point: int, beacons, cols, metric: Metric) -> BatchResult:
+    """Estimates a point on its average measurement, like get_estimation_point_from_average but without reading the store
+
+    :param cols: columns of beacons in the average measurement vectors
+    :returns: BatchResult of one estimate
+
+    """
+    (rssi_m, mcpd_m) = average_measurements()[point]
+    return get_estimation_batch(k, point, beacons, metric, rssi_m[cols], mcpd_m[cols], cache=cache, key=("average", point))
+
+
+def evaluate_combination(beacons) -> Dict[int, Dict[Metric, Dict[int, BatchResult]]]:
+    """Evaluates all train and validation points for one set of beacons
+
+    :param beacons: List of Beacon to use
+    :returns: Dict[k][metric][point] = BatchResult
+
+    """
+    results: Dict[int, Dict[Metric, Dict[int, BatchResult]]] = {}
+    # Columns of the beacons in the validation samples
+    cols = [configs.room.beacons.index(b) for b in beacons]
 
     # Get results for k = 3,5 and Chebyshev,Euclid norm, using Test set and Validation set
     for k in [3,5]:
         results[k] = {}
-        for metric in Metric:
+        for metric in METRICS:
             results[k][metric] = {}
             for p in configs.room.train_points:
-                results[k][metric][p] = [get_estimation_point_from_average(k, p, beacons, metric)]
+                results[k][metric][p] = estimate_average(k, p, beacons, cols, metric)
 
             # For each validation position
             for p in configs.room.validation_points:
-                # Generate empty result list
-                results[k][metric][p] = []
-                # Load the dataframes at this position and store them in the dictionary
-                df = {}
-                for b in beacons:
-                    df[b.n] = pd.read_csv("{}position_{}_beacon_{}.csv".format(configs.validation_set_path, p, b.n))
-                # Check length of measurement, on first one
-                length = len(list(df.items())[0][1].index)
-                # For each measurement, perform an estimation
-                for i in range(length):
-                    # Storage element for the measurement to be performed
-                    measurement = pd.DataFrame()
-                    # Combine data from the individual beacons into 'measurement'
-                    for b in df.keys():
-                        val = df[b].iloc[i,2:].to_frame().T
-                        val.insert(0, 'position', p)
-                        val.insert(1, 'id', b)
-                        measurement = pd.concat([measurement, val])
-                    # Evaluate the measurement, and append to results
-                    results[k][metric][p].append(get_estimation_point(k, p, beacons, metric, measurement))        
-
-    # Get result for each position by first averaging 15 measurements ONLY for all beacons
-    # Generate plots ONLY for all beacons
-    if len(beacons) == len(configs.room.beacons):
-        # Compute average results:
-        avg_results: Dict[int, Dict[Metric, Dict[int, Result]]] = {}
-        for k in [3,5]:
-            avg_results[k] = {}
-            for metric in Metric:
-                avg_results[k][metric] = {}
-                for p in configs.room.train_points:
-                    avg_results[k][metric][p] = get_estimation_point_from_average(k, p, beacons, metric)
-                for p in configs.room.validation_points:
-                    avg_results[k][metric][p] = get_estimation_point_from_average(k, p, beacons, metric)
-
-        # Generate Markdown table with average results
-        print("# Estimation on the average of 15 measurements, calculating then stats")
-        for k in [3,5]:
-            for metric in Metric:
-                idx = [p.idx for p in avg_results[k][metric].values()]
-                # Calculate average results
-                rssi_error = [p.rssi_euc_error for p in avg_results[k][metric].values()]
-                mcpd_error = [p.mcpd_euc_error for p in avg_results[k][metric].values()]
-                # Create dataframe with this informations
-                df = pd.DataFrame(data=[rssi_error, mcpd_error], columns=idx).round(decimals=3)
-                df.insert(0, "Type", ["RSSI", "MCPD"])
-                # Write markdown table
-                writer = MarkdownTableWriter(
-                    table_name="k{}_{}_error".format(k, metric),
-                    margin=1,
-                )
-                writer.from_dataframe(
-                    df,
-                    add_index_column=False,
-                )
-                writer.set_style(0, Style(font_weight="bold"))
-                # Print Markdown Table
-                print(writer.dumps())
-
-
-        # Generate plots:
-        colors = [(0, 0.4470, 0.7410), (0.8500, 0.3250, 0.0980), (0.9290, 0.6940, 0.1250), (0.4940, 0.1840, 0.5560), (0.4660, 0.6740, 0.1880), (0.3010, 0.7450, 0.9330), (0.6350, 0.0780, 0.1840)]
-
-        # Generate overview plot
-        plot_beautify(0, None, None)
-        for idx, p in enumerate(configs.room.validation_points.values()):
-            plt.scatter(p.x, p.y, 75, marker='*', color=colors[idx])
-        plot_store(0, None, None)
-
-        for k, metric, method in itertools.product([3, 5], [Metric.EUCLID, Metric.CHEBYSHEV], ["RSSI", "MCPD"]):
-            # Generate plot
-            plot_beautify(k, metric, method)
-            for idx,(p,point) in enumerate(configs.room.validation_points.items()):
-                res = get_estimation_point_from_average(k, p, beacons, metric)
-                plt.scatter(point.x, point.y, 75, marker='*', color=colors[idx])
-                if method == "RSSI":
-                    x = [val.rssi_estimation.x for val in results[k][metric][p]]
-                    x_avg = avg_results[k][metric][p].rssi_estimation.x
-                    y = [val.rssi_estimation.y for val in results[k][metric][p]]
-                    y_avg = avg_results[k][metric][p].rssi_estimation.y
-                else:
-                    x = [val.mcpd_estimation.x for val in results[k][metric][p]]
-                    x_avg = avg_results[k][metric][p].mcpd_estimation.x
-                    y = [val.mcpd_estimation.y for val in results[k][metric][p]]
-                    y_avg = avg_results[k][metric][p].mcpd_estimation.y
-                plt.scatter(x, y, 5, alpha=0.6, marker='o', color=colors[idx])
-                plt.scatter(x_avg, y_avg, 75, alpha=0.6, marker='o', color=colors[idx])
-
-            plot_store(k, metric, method)
-
-        # Generate Histogram
-        print("# Estimation each measurement, calculating then stats")
-        for k, metric, method in itertools.product([3, 5], [Metric.EUCLID, Metric.CHEBYSHEV], ["RSSI", "MCPD"]):
-            error = []
-            for idx,(p,point) in enumerate(configs.room.validation_points.items()):
-                if method == "RSSI":
-                    error.extend([val.rssi_euc_error for val in results[k][metric][p]])
-                else:
-                    error.extend([val.mcpd_euc_error for val in results[k][metric][p]])
-            print("{}, k={}, metric={}, Var: {:.2f}, Std: {:.2f}, Avg: {:.2f}, Max: {:.2f}, Min: {:.2f}".format(method, k, metric, np.var(error), np.std(error), np.mean(error), max(error), min(error)))
-            all_results[len(beacons)][k][metric][method]["var"].append(np.var(error))
-            all_results[len(beacons)][k][metric][method]["std"].append(np.std(error))
-            all_results[len(beacons)][k][metric][method]["avg"].append(np.mean(error))
-            all_results[len(beacons)][k][metric][method]["max"].append(max(error))
-            all_results[len(beacons)][k][metric][method]["min"].append(min(error))
-            xlim = [0, ceil(max(error))]
-            histogram_boxplot(error, k, metric, method, xlim=xlim, bins=20)
-    else:
-        # Print results
-        print("# Estimation each measurement, calculating then stats")
-        for k, metric, method in itertools.product([3, 5], [Metric.EUCLID, Metric.CHEBYSHEV], ["RSSI", "MCPD"]):
-            error = []
-            for idx,(p,point) in enumerate(configs.room.validation_points.items()):
-                if method == "RSSI":
-                    error.extend([val.rssi_euc_error for val in results[k][metric][p]])
-                else:
-                    error.extend([val.mcpd_euc_error for val in results[k][metric][p]])
-            print("{}, k={}, metric={}, Var: {:.3f}, Std: {:.3f}, Avg: {:.3f}, Max: {:.3f}, Min: {:.3f}".format(method, k, metric, np.var(error), np.std(error), np.mean(error), max(error), min(error)))        
-            all_results[len(beacons)][k][metric][method]["var"].append(np.var(error))
-            all_results[len(beacons)][k][metric][method]["std"].append(np.std(error))
-            all_results[len(beacons)][k][metric][method]["avg"].append(np.mean(error))
-            all_results[len(beacons)][k][metric][method]["max"].append(max(error))
-            all_results[len(beacons)][k][metric][method]["min"].append(min(error))
-    print("")
-
-for i in range(3, len(configs.room.beacons)+1):
-    print("# Overall stats for {} Beacon setups:".format(i))
+                # Measurements of the used beacons (samples x beacons x [rssi, mcpd_ifft])
+                measurement = validation_samples[p][:, cols, :]
+                # Evaluate all measurements at once
+                batch = get_estimation_batch(k, p, beacons, metric, measurement[..., 0], measurement[..., 1], cache=cache, key=("validation", p))
+                results[k][metric][p] = batch
+    return results
+
+
+def validation_errors(results) -> Dict[int, Dict[Metric, Dict[str, np.ndarray]]]:
+    """Collects the estimation errors of all validation points
+
+    :param results: Dict[k][metric][point] = BatchResult
+    :returns: Dict[k][metric][method] = array of errors
+
+    """
+    errors: Dict[int, Dict[Metric, Dict[str, np.ndarray]]] = {k: {metric: {} for metric in METRICS} for k in [3, 5]}
     for k, metric, method in itertools.product([3, 5], [Metric.EUCLID, Metric.CHEBYSHEV], ["RSSI", "MCPD"]):
-        print("{}, k={}, metric={}, Var: {:.3f}, Std: {:.3f}, Avg: {:.3f}, Max: {:.3f}, Min: {:.3f}".format(method, k, metric, np.mean(all_results[i][k][metric][method]["var"]), np.mean(all_results[i][k][metric][method]["std"]), np.mean(all_results[i][k][metric][method]["avg"]), max(all_results[i][k][metric][method]["max"]), min(all_results[i][k][metric][method]["min"])))
+        if method == "RSSI":
+            error = [results[k][metric][p].rssi_euc_error for p in configs.room.validation_points]
+        else:
+            error = [results[k][metric][p].mcpd_euc_error for p in configs.room.validation_points]
+        errors[k][metric][method] = np.concatenate(error)
+    return errors
+
+
+def average_estimates(beacons) -> Dict[int, Dict[Metric, Dict[int, BatchResult]]]:
+    """Estimates the validation points on their average measurement, the distances are taken from the cache
+
+    :param beacons: List of Beacon to use
+    :returns: Dict[k][metric][point] = BatchResult
+
+    """
+    cols = [configs.room.beacons.index(b) for b in beacons]
+    return {
+        k: {metric: {p: estimate_average(k, p, beacons, cols, metric) for p in configs.room.validation_points} for metric in METRICS}
+        for k in [3, 5]
+    }
+
+
+def result_tables(beacons, results, averages, errors) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Flattens the results of one combination of beacons into the tables of the results store
+
+    :param beacons: List of Beacon used
+    :param results: Dict[k][metric][point] = BatchResult, see evaluate_combination
+    :param averages: Dict[k][metric][point] = BatchResult, see average_estimates
+    :param errors: Dict[k][metric][method] = array of errors, see validation_errors
+    :returns: (estimates, aggregates), Dataframes with the columns of results_store.TABLES without 'run'
+
+    """
+    key = beacon_key(beacons)
+    columns = defaultdict(list)
+    for k, metric, method in itertools.product([3, 5], METRICS, ["RSSI", "MCPD"]):
+        prefix = method.lower()
+        # Train points were estimated on their average, validation points on their average and on each measurement
+        parts = [(p, "average", results[k][metric][p]) for p in configs.room.train_points]
+        parts += [(p, "average", averages[k][metric][p]) for p in configs.room.validation_points]
+        parts += [(p, "sample", results[k][metric][p]) for p in configs.room.validation_points]
+        for p, kind, batch in parts:
+            estimation = getattr(batch, "{}_estimation".format(prefix))
+            n = len(estimation)
+            columns["k"].append(np.full(n, k))
+            columns["metric"].append(np.full(n, metric.name, dtype=object))
+            columns["method"].append(np.full(n, method, dtype=object))
+            columns["position"].append(np.full(n, p))
+            columns["kind"].append(np.full(n, kind, dtype=object))
+            columns["x"].append(estimation[:, 0])
+            columns["y"].append(estimation[:, 1])
+            columns["error"].append(getattr(batch, "{}_euc_error".format(prefix)))
+    estimates = pd.DataFrame({name: np.concatenate(values) for name, values in columns.items()})
+    estimates.insert(0, "beacons", key)
+
+    aggregates = pd.DataFrame.from_records([
+        {
+            "beacons": key,
+            "n_beacons": len(beacons),
+            "k": k,
+            "metric": metric.name,
+            "method": method,
+            "estimates": len(error),
+            "var": np.var(error),
+            "std": np.std(error),
+            "avg": np.mean(error),
+            "max": np.max(error),
+            "min": np.min(error),
+        }
+        for k, metric, method in itertools.product([3, 5], [Metric.EUCLID, Metric.CHEBYSHEV], ["RSSI", "MCPD"])
+        for error in [errors[k][metric][method]]
+    ])
+    return (estimates, aggregates)
+
+
+def evaluate(beacons):
+    """Work unit of the sweep: evaluates one combination of beacons
+
+    :param beacons: tuple of Beacon
+    :returns: (beacons, estimates, aggregates), see result_tables
+
+    """
+    beacons = list(beacons)
+    results = evaluate_combination(beacons)
+    errors = validation_errors(results)
+    return (beacons, *result_tables(beacons, results, average_estimates(beacons), errors))
+
+
+def evaluate_chunk(subsets):
+    """Work unit of the sweep: evaluates a chunk of combinations of beacons, sharing the distance computation
+
+    :param subsets: List of tuple of Beacon
+    :returns: List of (beacons, estimates, aggregates), see evaluate
+
+    """
+    prefill([list(beacons) for beacons in subsets])
+    chunk = [evaluate(beacons) for beacons in subsets]
+    cache.clear()
+    return chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluates wkNN for all combinations of beacons")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("-c", "--chunksize", type=int, default=8, help="Combinations of beacons per work unit, sharing their distance computation")
+    parser.add_argument("--run-id", default=None, help="Id of the run in the results store (default: the start time)")
+    parser.add_argument("--no-report", action="store_true", help="Only store the results, print the report later with report.py")
+    parser.add_argument("--no-figures", action="store_true", help="Only store the results, render the figures later with render_figures.py")
+    args = parser.parse_args()
+
+    run = args.run_id or new_run_id()
+    combinations = []
+    for i in range(3, len(configs.room.beacons)+1):
+        combinations += list(itertools.combinations(configs.room.beacons, i))
+
+    # Load all reference data once, the workers receive it through their initializer
+    store.preload()
+    validation_samples = load_validation_samples(configs.room.beacons)
+
+    tables = {"estimates": [], "aggregates": []}
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(store, validation_samples)) as executor:
+        # map() yields in submission order, so the results are stored deterministically
+        chunks = [combinations[i:i + args.chunksize] for i in range(0, len(combinations), args.chunksize)]
+        for beacons, estimates, aggregates in itertools.chain.from_iterable(executor.map(evaluate_chunk, chunks)):
+            tables["estimates"].append(estimates)
+            tables["aggregates"].append(aggregates)
+
+    results = ResultsStore()
+    for table, frames in tables.items():
+        rows = pd.concat(frames, ignore_index=True)
+        rows.insert(0, "run", run)
+        results.append(table, rows)
+
+    if not args.no_report:
+        import report
+        report.print_report(results, run)
+    if not args.no_figures:
+        import render_figures
+        render_figures.main(run, args.jobs)
@@ -1,8 +1,12 @@
-from dataclasses import dataclass
-from typing import List, Dict, Union
-from typing_extensions import Self
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, List, Dict, Union
+import json
 import math
 
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
 @dataclass
 class Point:
     x: float
@@ -44,36 +48,90 @@ class Room:
     validation_points: Dict[int, Point]
 
 
-room = Room(
-    # 5 and 6 are switched!
-    beacons=[
-        Beacon(uuid="EE:6F:EE:A7:34:31", n=1, position=Point(x=0, y=0)),
-        Beacon(uuid="DE:64:59:3D:8E:63", n=2, position=Point(x=0, y=8.85 / 2)),
-        Beacon(uuid="F1:63:F2:BE:56:44", n=3, position=Point(x=0, y=8.85)),
-        Beacon(uuid="DB:6D:40:6D:A1:0F", n=4, position=Point(x=7.3, y=8.85)),
-        Beacon(uuid="FC:40:5D:54:A7:DD", n=6, position=Point(x=7.3, y=8.85 / 2)),
-        Beacon(uuid="FF:B4:7D:AB:1B:A2", n=5, position=Point(x=7.3, y=0)),
-    ],
-    size=Point(x=7.3, y=8.85),
-    train_points={
-        1: Point(x=1, y=1.5),
-        2: Point(x=3.65, y=1.5),
-        3: Point(x=7.3 - 1, y=1.5),
-        4: Point(x=1, y=4.425),
-        5: Point(x=3.65, y=4.425),
-        6: Point(x=7.3 - 1, y=4.425),
-        7: Point(x=1, y=8.85 - 1.5),
-        8: Point(x=3.65, y=8.85 - 1.5),
-        9: Point(x=7.3 - 1, y=8.85 - 1.5),
-    },
-    validation_points={
-        11: Point(x=7.3 - 2.3, y=8.85 - 1.9),
-        12: Point(x=2.05, y=2.7),
-        13: Point(x=7.3 - 2.07, y=2.9),
-        14: Point(x=1.8, y=8.85 - 2.5),
-        15: Point(x=7.3 - 3.7, y=8.85 - 2.6),
-    },
-)
+@dataclass
+class Site:
+    """All rooms (or floors) of a building, each with its own beacons and reference points
+
+    Position numbers are unique within the site, beacons may be shared by rooms.
+    """
+    rooms: Dict[str, Room]
+    beacons: List[Beacon] = field(init=False)
+    train_points: Dict[int, Point] = field(init=False)
+    validation_points: Dict[int, Point] = field(init=False)
+
+    def __post_init__(self):
+        # Site-wide views, in the order of the rooms
+        beacons = {}
+        for room in self.rooms.values():
+            for b in room.beacons:
+                beacons.setdefault(b.n, b)
+        self.beacons = list(beacons.values())
+        self.train_points = {p: point for room in self.rooms.values() for p, point in room.train_points.items()}
+        self.validation_points = {p: point for room in self.rooms.values() for p, point in room.validation_points.items()}
+
+    def room_of(self, point: int) -> str:
+        """Name of the room holding a train or validation point"""
+        for name, room in self.rooms.items():
+            if point in room.train_points or point in room.validation_points:
+                return name
+        raise ValueError("Point {} does not exist".format(point))
+
+
+def _point(value: Dict[str, float]) -> Point:
+    return Point(x=value["x"], y=value["y"])
+
+
+def parse_site(description: Dict[str, Any]) -> Site:
+    """Builds a site from its description
+
+    The description is a dict: {"rooms": {name: {"size": {"x", "y"}, "beacons": [{"uuid", "n", "position": {"x", "y"}}],
+    "train_points": {number: {"x", "y"}}, "validation_points": {number: {"x", "y"}}}}}, further keys are ignored.
+
+    :param description: parsed JSON
+    :returns: Site
+
+    """
+    return Site(rooms={
+        name: Room(
+            beacons=[Beacon(uuid=b["uuid"], n=b["n"], position=_point(b["position"])) for b in room["beacons"]],
+            size=_point(room["size"]),
+            train_points={int(p): _point(point) for p, point in room["train_points"].items()},
+            validation_points={int(p): _point(point) for p, point in room.get("validation_points", {}).items()},
+        )
+        for name, room in description["rooms"].items()
+    })
+
+
+def describe_site(site: Site) -> Dict[str, Any]:
+    """The description of a site, the inverse of parse_site"""
+    return {"rooms": {name: asdict(room) for name, room in site.rooms.items()}}
+
+
+def load_site(path: str) -> Site:
+    """Reads a site description from a JSON file, see parse_site
+
+    :param path: file to read
+    :returns: Site
+
+    """
+    with open(path) as f:
+        return parse_site(json.load(f))
+
+
+def __getattr__(name: str):
+    # The site is read on first use, so importing configs does not touch the disk
+    if name == "site":
+        globals()["site"] = load_site(site_path)
+        return globals()["site"]
+    if name == "room":
+        # The first room, used by the evaluation of a single room (compute_results.py)
+        globals()["room"] = next(iter(__getattr__("site").rooms.values()))
+        return globals()["room"]
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+
+# Description of the rooms, beacons and reference points, loaded on first access of configs.site (and configs.room)
+site_path = '../site.json'
 
 uart_columns = ['uuid', 'state', 'rssi', 'mcpd_ifft', 'mcpd_phase_slope', 'mcpd_rssi_openspace', 'best']
 
@@ -81,3 +139,16 @@ raw_data_path = '../raw_data/'
 train_set_path = '../data/train_set/'
 test_set_path = '../data/test_set/'
 validation_set_path = '../data/validation_set/'
+# Lines of the raw data that are no valid measurement
+quarantine_path = '../data/quarantine/'
+# Hashes of the raw data and the averages computed from them (see test_validation_split.py)
+split_manifest_path = '../data/split_manifest.json'
+# Columnar file holding all single measurements of a set (see dataset.py)
+dataset_filename = 'samples.col'
+# Site model and train fingerprint compiled for the online estimation (see artifact.py)
+artifact_path = '../data/fingerprint.wkfp'
+# Appendable store of the estimates and statistics of all runs of compute_results.py (see results_store.py)
+results_store_path = '../data/results/'
+figures_path = '../figures/'
+# Hashes of the inputs of each figure (see render_figures.py)
+figure_manifest_path = '../figures/manifest.json'
@@ -0,0 +1,278 @@
+#!/bin/python
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from pytablewriter import MarkdownTableWriter
+import configs
+from dataset import load_dataset
+from fingerprint import Fingerprint
+from neighbors import k_nearest
+from wknn import Metric, compute_estimation_batch, get_ground_truth
+
+
+@dataclass
+class SampleSet:
+    """All single measurements of the train positions, held in memory"""
+    beacons: list
+    # Position number of each sample (samples)
+    positions: np.ndarray
+    # Measurements (samples x beacons x [rssi, mcpd_ifft])
+    values: np.ndarray
+
+
+@dataclass
+class Fold:
+    """One split of a SampleSet: a fingerprint of averages and the held out samples to estimate"""
+    scheme: str
+    repeat: int
+    fold: int
+    reference: Fingerprint
+    # Position number of each held out sample, and the samples (queries x beacons x [rssi, mcpd_ifft])
+    positions: np.ndarray
+    values: np.ndarray
+
+
+def load_samples(beacons=None, points=None, paths: List[str] = None) -> SampleSet:
+    """Reads the single measurements of the train and test set, which together are all measurements of the train positions
+
+    :param beacons: List of Beacon, defaults to the beacons of configs.room
+    :param points: position numbers, defaults to the train points of configs.room
+    :param paths: directories of the sets to read, defaults to the train and test set
+    :returns: SampleSet
+
+    """
+    beacons = beacons or configs.room.beacons
+    points = list(points or configs.room.train_points)
+    paths = paths or [configs.train_set_path, configs.test_set_path]
+    datasets = [load_dataset("{}{}".format(path, configs.dataset_filename)) for path in paths]
+    (positions, values) = ([], [])
+    for p in points:
+        for d in datasets:
+            stack = d.stack(p, beacons)
+            positions.append(np.full(len(stack), p))
+            values.append(stack)
+    return SampleSet(beacons, np.concatenate(positions), np.concatenate(values))
+
+
+def group_sums(values, groups, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sums the rows of values per group, with one sort instead of a loop over the groups
+
+    :param values: array (rows x ...)
+    :param groups: group index of each row, in 0..n-1
+    :param n: number of groups
+    :returns: (sums, counts), arrays (n x ...) and (n)
+
+    """
+    order = np.argsort(groups, kind="stable")
+    counts = np.bincount(groups, minlength=n)
+    starts = np.searchsorted(groups[order], np.arange(n))
+    sums = np.zeros((n,) + values.shape[1:])
+    if len(values):
+        sums[counts > 0] = np.add.reduceat(values[order], starts[counts > 0], axis=0)
+    return (sums, counts)
+
+
+def window_means(positions, values, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Averages blocks of window consecutive samples of the same position, dropping incomplete blocks
+
+    :param positions: position number of each sample
+    :param values: array (samples x ...)
+    :param window: samples per block
+    :returns: (positions, means) of the blocks
+
+    """
+    if window == 1:
+        return (positions, values)
+    (points, index) = np.unique(positions, return_inverse=True)
+    order = np.argsort(index, kind="stable")
+    counts = np.bincount(index, minlength=len(points))
+    # Rank of each sample within its position, in the order of measurement
+    rank = np.empty(len(positions), dtype=int)
+    rank[order] = np.arange(len(positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+    blocks = counts // window
+    keep = rank < blocks[index] * window
+    offsets = np.cumsum(blocks) - blocks
+    block = (offsets[index] + rank // window)[keep]
+    (sums, _) = group_sums(values[keep], block, int(blocks.sum()))
+    return (np.repeat(points, blocks), sums / window)
+
+
+def group_moments(values, groups, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sums the rows of values per group, and their squared differences from the mean of the group
+
+    The squares are summed around the mean of each group, so they do not cancel
+    like a sum of squares minus a squared sum does for values far from 0 (RSSI).
+
+    :returns: (sums, counts, m2), arrays (n x ...), (n) and (n x ...)
+
+    """
+    (sums, counts) = group_sums(values, groups, n)
+    means = sums / np.fmax(counts, 1).reshape((n,) + (1,) * (values.ndim - 1))
+    (m2, _) = group_sums((values - means[groups]) ** 2, groups, n)
+    return (sums, counts, m2)
+
+
+def merge_moments(sums, counts, m2, axis: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merges the moments of groups along an axis into the moments of their union, with the formula of Chan et al. (see stats.Welford)
+
+    :param sums: array of the sums of the groups
+    :param counts: array of the counts of the groups, the shape of sums without the trailing dimensions
+    :param m2: array of the squared differences from the mean of each group, summed
+    :returns: (sums, counts, m2) of the unions
+
+    """
+    c = counts.reshape(counts.shape + (1,) * (sums.ndim - counts.ndim))
+    total = c.sum(axis=axis, keepdims=True)
+    delta = sums / np.fmax(c, 1) - sums.sum(axis=axis, keepdims=True) / np.fmax(total, 1)
+    return (sums.sum(axis=axis), counts.sum(axis=axis), m2.sum(axis=axis) + (c * delta ** 2).sum(axis=axis))
+
+
+def fingerprint(samples: SampleSet, sums, counts, m2, points) -> Fingerprint:
+    """Builds the fingerprint of the averages and variances of some positions from their moments (see group_moments)
+
+    The variances are sample variances (ddof=1) like in results_avg.csv, nan for less than two samples.
+
+    """
+    n = counts[:, None, None].astype(float)
+    means = sums / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variances = np.where(n > 1, m2 / (n - 1), np.nan)
+    coordinates = [[configs.site.train_points[p].x, configs.site.train_points[p].y] for p in points]
+    return Fingerprint(points, [b.n for b in samples.beacons], means[..., 0], means[..., 1], variances[..., 0], variances[..., 1], coordinates)
+
+
+def leave_one_position_out(samples: SampleSet) -> Iterator[Fold]:
+    """Estimates the samples of each position on the averages of all other positions"""
+    (points, index) = np.unique(samples.positions, return_inverse=True)
+    (sums, counts, m2) = group_moments(samples.values, index, len(points))
+    for i, p in enumerate(points.tolist()):
+        others = np.arange(len(points)) != i
+        held_out = index == i
+        reference = fingerprint(samples, sums[others], counts[others], m2[others], points[others])
+        yield Fold("leave-one-position-out", 0, i, reference, samples.positions[held_out], samples.values[held_out])
+
+
+def k_fold(samples: SampleSet, folds: int = 5, repeats: int = 1, seed: int = 0) -> Iterator[Fold]:
+    """Repeated random k-fold, stratified by position: estimates the samples of each fold on the averages of all other folds"""
+    rng = np.random.default_rng(seed)
+    (points, index) = np.unique(samples.positions, return_inverse=True)
+    counts = np.bincount(index, minlength=len(points))
+    for r in range(repeats):
+        # Deal the shuffled samples of each position round robin onto the folds
+        order = np.lexsort((rng.random(len(index)), index))
+        assignment = np.empty(len(index), dtype=int)
+        assignment[order] = (np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)) % folds
+        (sums, fold_counts, m2) = group_moments(samples.values, index * folds + assignment, len(points) * folds)
+        sums = sums.reshape((len(points), folds) + sums.shape[1:])
+        m2 = m2.reshape((len(points), folds) + m2.shape[1:])
+        fold_counts = fold_counts.reshape(len(points), folds)
+        for f in range(folds):
+            held_out = assignment == f
+            others = np.arange(folds) != f
+            reference = fingerprint(samples, *merge_moments(sums[:, others], fold_counts[:, others], m2[:, others], axis=1), points)
+            yield Fold("{}-fold".format(folds), r, f, reference, samples.positions[held_out], samples.values[held_out])
+
+
+def evaluate_fold(fold: Fold, beacons, ks: List[int], metrics: List[Metric], windows: List[int], subsets: List[list] = None) -> List[dict]:
+    """Estimates the held out samples of a fold for all k, metrics, averaging windows and beacon subsets
+
+    Per window and metric, the distances of all beacon subsets are derived from
+    one set of per-beacon differences (Fingerprint.subset_norms). Per subset the
+    k closest are selected once for the largest k, as they are sorted by
+    distance the k closest of every smaller k are a prefix of them.
+
+    :param beacons: List of Beacon in the order of the measurement columns of the fold
+    :param subsets: Lists of Beacon to estimate with, defaults to all beacons
+    :returns: one row per window, k, metric, subset and method, holding the mean error, the number of estimates and the time spent on them
+
+    """
+    subsets = subsets or [beacons]
+    reference = fold.reference
+    if max(ks) > len(reference.positions):
+        raise ValueError("k={} exceeds the {} reference positions of fold {} of {}".format(max(ks), len(reference.positions), fold.fold, fold.scheme))
+    coordinates = reference.coordinates
+    if coordinates is None:
+        coordinates = np.array([[configs.site.train_points[p].x, configs.site.train_points[p].y] for p in reference.positions.tolist()])
+    kmax = max(ks)
+    rows = []
+    for window in windows:
+        (points, queries) = window_means(fold.positions, fold.values, window)
+        if len(points) == 0:
+            continue
+        truth = {p: get_ground_truth(p) for p in np.unique(points).tolist()}
+        truth = np.array([[truth[p].x, truth[p].y] for p in points.tolist()])
+        for metric in metrics:
+            start = time.perf_counter()
+            norms = reference.subset_norms(queries[..., 0], queries[..., 1], beacons, subsets, metric)
+            # Time of the shared distance computation, per subset and method
+            shared = (time.perf_counter() - start) / (2 * len(subsets))
+            for method, subset_norms in zip(["RSSI", "MCPD"], norms):
+                for subset, distances in zip(subsets, subset_norms):
+                    start = time.perf_counter()
+                    (idx, dist) = k_nearest(distances, kmax)
+                    selection = time.perf_counter() - start
+                    for k in ks:
+                        start = time.perf_counter()
+                        estimation = compute_estimation_batch(coordinates, idx[:, :k], dist[:, :k])
+                        latency = shared + selection + time.perf_counter() - start
+                        error = np.hypot(*(estimation - truth).T)
+                        rows.append({
+                            "scheme": fold.scheme,
+                            "repeat": fold.repeat,
+                            "fold": fold.fold,
+                            "window": window,
+                            "k": k,
+                            "metric": str(metric),
+                            "beacons": str([b.n for b in subset]),
+                            "method": method,
+                            "error": float(error.mean()),
+                            "estimates": len(error),
+                            "latency": latency,
+                        })
+    return rows
+
+
+def cross_validate(folds: Iterator[Fold], beacons, ks: List[int], metrics: List[Metric], windows: List[int]) -> pd.DataFrame:
+    """Evaluates all folds
+
+    :returns: A Dataframe with one row per fold, window, k, metric and method
+
+    """
+    rows = []
+    for fold in folds:
+        rows += evaluate_fold(fold, beacons, ks, metrics, windows)
+    return pd.DataFrame.from_records(rows)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Averages the errors over the folds, weighted by their number of estimates"""
+    results = results.assign(total=results["error"] * results["estimates"])
+    summary = results.groupby(["scheme", "window", "k", "metric", "method"], sort=False)[["total", "estimates"]].sum()
+    summary["error"] = summary["total"] / summary["estimates"]
+    return summary.drop(columns="total").reset_index().sort_values("error", kind="stable")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validates wkNN on the single measurements of the train positions")
+    parser.add_argument("-s", "--scheme", choices=["lopo", "kfold"], default="kfold", help="Leave one position out or repeated k-fold")
+    parser.add_argument("-f", "--folds", type=int, default=5, help="Folds of the k-fold")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Repetitions of the k-fold")
+    parser.add_argument("-k", type=int, nargs="+", default=[3, 5], help="k-closest Neighbors")
+    parser.add_argument("-m", "--metrics", nargs="+", choices=[m.name for m in Metric], default=[Metric.EUCLID.name, Metric.CHEBYSHEV.name])
+    parser.add_argument("-w", "--windows", type=int, nargs="+", default=[1], help="Samples averaged per estimate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    if args.scheme == "lopo":
+        folds = leave_one_position_out(samples)
+    else:
+        folds = k_fold(samples, args.folds, args.repeats, args.seed)
+    results = cross_validate(folds, samples.beacons, args.k, [Metric[m] for m in args.metrics], args.windows)
+
+    writer = MarkdownTableWriter(table_name="cross_validation", margin=1)
+    writer.from_dataframe(summarize(results).round(decimals=3), add_index_column=False)
+    print(writer.dumps())
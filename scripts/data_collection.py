@@ -1,34 +1,23 @@
 #!/usr/bin/python
-import subprocess
 import threading
 import time
-import psutil
 import curses
 import sys
 from configs import room
+from uart import UartIngest
+
+DEVICE = "/dev/ttyACM0"
 
 class color:
    BOLD = '\033[1m'
    END = '\033[0m'
 
-def kill(proc_pid):
-    process = psutil.Process(proc_pid)
-    for proc in process.children(recursive=True):
-        proc.kill()
-    process.kill()
-
-
-def get_string_repetition(searchstr, file):
-    p1 = subprocess.Popen(["rg", searchstr, file], stdout=subprocess.PIPE)
-    p2 = subprocess.Popen(["wc", "-l"], stdin=p1.stdout, stdout=subprocess.PIPE)
-    out, err = p2.communicate()
-    return int(out.strip().decode("ascii"))
-
-
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("No file given")
         exit()
+    # Optionally read from another device, e.g. a pty for testing
+    device = sys.argv[2] if len(sys.argv) > 2 else DEVICE
 
     stdscr = curses.initscr()
     curses.start_color()
@@ -38,13 +27,21 @@ if __name__ == "__main__":
     curses.init_pair(4, curses.COLOR_RED, curses.COLOR_BLACK)
     curses.init_pair(5, curses.COLOR_GREEN, curses.COLOR_BLACK)
     curses.init_pair(6, curses.COLOR_BLUE, curses.COLOR_BLACK)
+    filename = "../raw_data/" + sys.argv[1]
+    output = open(filename, "a+")
+    ingest = UartIngest(output)
+    # Count the records of an existing file as well
+    output.seek(0)
+    for line in output:
+        ingest.update(line)
+    stop = threading.Event()
+    reader = threading.Thread(target=ingest.run, args=(device, stop), daemon=True)
     try:
         curses.noecho()
         curses.cbreak()
         stdscr.keypad(True)
         
-        filename = "../raw_data/" + sys.argv[1]
-        p = subprocess.Popen(["./screen_read.sh", filename])
+        reader.start()
         stdscr.clear()
         stdscr.addstr(3, 3, "Writing to file '" + filename + "'")
         while True:
@@ -52,7 +49,9 @@ if __name__ == "__main__":
                 stdscr.move(beacon.n+4, 5)
                 stdscr.addstr(str(beacon.uuid) + " (" + str(beacon.n) + ")", curses.color_pair(beacon.n) | curses.A_BOLD)
                 stdscr.addstr(" has got ")
-                stdscr.addstr(str(get_string_repetition(beacon.uuid, filename)), curses.color_pair(beacon.n) | curses.A_BOLD)
+                stats = ingest.stats[beacon.uuid]
+                stdscr.addstr(str(stats.count), curses.color_pair(beacon.n) | curses.A_BOLD)
+                stdscr.addstr(" (avg. RSSI {:.1f}, avg. MCPD {:.2f})    ".format(stats.rssi, stats.mcpd_ifft))
 
             stdscr.move(len(room.beacons)+5, 5)
             stdscr.refresh()
@@ -60,7 +59,9 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         pass
     finally:
-        kill(p.pid)
+        stop.set()
+        ingest.flush()
+        output.close()
         curses.nocbreak()
         stdscr.keypad(False)
         curses.echo()
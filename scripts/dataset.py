@@ -0,0 +1,187 @@
+from typing import Dict, Tuple
+import hashlib
+import json
+import os
+import numpy as np
+
+# Typed columns of a dataset file, in storage order
+COLUMNS = [
+    ("position", "<i4"),
+    ("id", "<i4"),
+    ("rssi", "<f8"),
+    ("mcpd_ifft", "<f8"),
+    ("mcpd_phase_slope", "<f8"),
+    ("mcpd_rssi_openspace", "<f8"),
+    ("best", "<f8"),
+]
+
+MAGIC = b"WKNNCOL\x01"
+# Every column starts at a multiple of this, so the memory maps are aligned
+ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def file_hash(path: str) -> str:
+    """sha256 of the content of a file, read in blocks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_columns(path: str, columns: Dict[str, np.ndarray], header: dict, magic: bytes = MAGIC):
+    """Writes arrays into a single columnar file, replacing it atomically
+
+    Layout: magic, the length of the header (uint64), a JSON header and the
+    arrays one after another, each aligned for memory mapping. The header gets
+    an entry {"name", "dtype", "shape", "offset"} per array under "columns".
+
+    :param path: file to write
+    :param columns: Dict[name] = array, in storage order
+    :param header: JSON-serializable metadata stored in front of the arrays
+    :param magic: bytes identifying the kind of file
+
+    """
+    columns = {name: np.ascontiguousarray(column) for name, column in columns.items()}
+    header = dict(header, columns=[])
+    # The header size depends on the offsets of the columns behind it, grow the space until it fits
+    start = 0
+    encoded = json.dumps(header).encode("ascii")
+    while len(magic) + 8 + len(encoded) > start:
+        start = _aligned(len(magic) + 8 + len(encoded))
+        offset = start
+        header["columns"] = []
+        for name, column in columns.items():
+            header["columns"].append({"name": name, "dtype": column.dtype.str, "shape": list(column.shape), "offset": offset})
+            offset = _aligned(offset + column.nbytes)
+        encoded = json.dumps(header).encode("ascii")
+
+    # Readers never see a partly written file
+    temporary = "{}.tmp".format(path)
+    with open(temporary, "wb") as f:
+        f.write(magic)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        for column in header["columns"]:
+            f.seek(column["offset"])
+            f.write(columns[column["name"]].tobytes())
+        f.truncate(offset)
+    os.replace(temporary, path)
+
+
+def read_header(path: str, magic: bytes = MAGIC, kind: str = "dataset") -> dict:
+    """Reads the JSON header of a file written by write_columns
+
+    :param path: file to read
+    :param magic: bytes the file has to start with
+    :param kind: name of the kind of file, for the error message
+    :returns: the header, with the entries of the arrays under "columns"
+
+    """
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError("{} is not a {} file".format(path, kind))
+        length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(length))
+
+
+def map_column(path: str, column: dict) -> np.ndarray:
+    """Memory-maps one array of a file written by write_columns
+
+    :param path: file to read
+    :param column: entry of the array in the "columns" of the header
+    :returns: read-only array (an empty array for no elements, which can not be mapped)
+
+    """
+    if 0 in column["shape"]:
+        return np.empty(column["shape"], dtype=column["dtype"])
+    return np.memmap(path, dtype=column["dtype"], mode="r", offset=column["offset"], shape=tuple(column["shape"]))
+
+
+def write_dataset(samples, path: str):
+    """Writes measurements into a single columnar file (see write_columns)
+
+    The rows are ordered by position and beacon (keeping the order of the
+    measurements), so all measurements of one position and beacon are a
+    contiguous slice of each column.
+
+    :param samples: A Dataframe containing headers 'position', 'id', 'rssi', 'mcpd_ifft', 'mcpd_phase_slope', 'mcpd_rssi_openspace', 'best'
+    :param path: file to write
+
+    """
+    samples = samples.sort_values(["position", "id"], kind="stable")
+    columns = {name: samples[name].to_numpy(dtype=dtype) for name, dtype in COLUMNS}
+
+    # Contiguous row range of each (position, beacon)
+    groups = {}
+    keys = np.stack([columns["position"], columns["id"]], axis=1)
+    if len(keys):
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        stops = np.r_[starts[1:], len(keys)]
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            groups["{},{}".format(*keys[start])] = [start, stop]
+
+    write_columns(path, columns, {"version": 1, "rows": len(samples), "groups": groups})
+
+
+class Dataset:
+    """Read-only, memory-mapped view of a file written by write_dataset"""
+
+    def __init__(self, path: str):
+        header = read_header(path)
+        self.path = path
+        self.rows: int = header["rows"]
+        self.groups: Dict[Tuple[int, int], slice] = {
+            tuple(map(int, key.split(","))): slice(*value) for key, value in header["groups"].items()
+        }
+        # Files written before write_columns have no shapes
+        self.columns: Dict[str, np.ndarray] = {column["name"]: map_column(path, {"shape": [self.rows], **column}) for column in header["columns"]}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def group(self, position: int, beacon: int) -> Dict[str, np.ndarray]:
+        """All measurements of one beacon at one position, as views into the columns
+
+        :param position: number of the measurement position
+        :param beacon: number of the beacon (Beacon.n)
+        :returns: Dict[column] = array
+
+        """
+        rows = self.groups[(position, beacon)]
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def stack(self, position: int, beacons, features=("rssi", "mcpd_ifft")) -> np.ndarray:
+        """Stacks the measurements of several beacons at one position, pairing the i-th measurement of each beacon
+
+        :param position: number of the measurement position
+        :param beacons: List of Beacon
+        :param features: columns to stack
+        :returns: array (samples x beacons x features), limited to the samples of the beacon with the fewest measurements
+
+        """
+        rows = [self.groups[(position, b.n)] for b in beacons]
+        length = min(r.stop - r.start for r in rows)
+        return np.stack(
+            [np.stack([self.columns[f][r.start:r.start + length] for f in features], axis=-1) for r in rows],
+            axis=1,
+        )
+
+    def to_dataframe(self, position: int = None, beacon: int = None):
+        """Copies the whole dataset, or one (position, beacon) group, into a Dataframe"""
+        import pandas as pd
+        if position is None:
+            return pd.DataFrame({name: np.array(column) for name, column in self.columns.items()})
+        return pd.DataFrame({name: np.array(column) for name, column in self.group(position, beacon).items()})
+
+
+def load_dataset(path: str) -> Dataset:
+    """Opens a dataset file written by write_dataset, without reading the columns into memory"""
+    return Dataset(path)
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Hashable, Tuple
+import numpy as np
+from fingerprint import Fingerprint
+from reference_store import ReferenceStore, default_store
+
+
+class DistanceCache:
+    """Bounded LRU cache of the distances from measurements to all reference positions
+
+    Entries are keyed on the identity of the measurement (chosen by the caller,
+    e.g. ("validation", point)), the beacon subset and the metric. As the full
+    distance vectors are stored, the k closest can be derived for any k without
+    computing the distances again. The cache empties itself when the store
+    returns new reference data.
+    """
+
+    def __init__(self, store: ReferenceStore = None, maxsize: int = 4096):
+        """
+        :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+        :param maxsize: maximum number of entries
+
+        """
+        self.store = store or default_store
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._reference: Fingerprint = None
+        self._entries: "OrderedDict[Hashable, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+
+    @property
+    def reference(self) -> Fingerprint:
+        reference = self.store.fingerprint()
+        if reference is not self._reference:
+            self._entries.clear()
+            self._reference = reference
+        return reference
+
+    def distances(self, key: Hashable, beacons, metric, rssi, mcpd) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the distances of the measurements to all reference positions, computing them on a miss
+
+        :param key: identity of the measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param metric: Chebyshev or Euclidian norm (enum)
+        :param rssi: RSSI of the measurements, (beacons) or (N x beacons), only used on a miss
+        :param mcpd: MCPD of the measurements, (beacons) or (N x beacons), only used on a miss
+        :returns: (rssi_vector_norm, mcpd_vector_norm), arrays (positions) or (N x positions)
+
+        """
+        reference = self.reference
+        entry_key = (key, tuple(b.n for b in beacons), metric)
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(entry_key)
+            return entry
+        self.misses += 1
+        entry = reference.norm(rssi, mcpd, beacons, metric)
+        self._entries[entry_key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def fill(self, key: Hashable, beacons, subsets, metric, rssi, mcpd):
+        """Computes the distances for many subsets of beacons at once and stores one entry per subset
+
+        :param key: identity of the measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param subsets: List of subsets (lists of Beacon) of beacons
+        :param metric: Chebyshev or Euclidian norm (enum)
+        :param rssi: RSSI of the measurements, (beacons) or (N x beacons)
+        :param mcpd: MCPD of the measurements, (beacons) or (N x beacons)
+
+        """
+        (rssi_norms, mcpd_norms) = self.reference.subset_norms(rssi, mcpd, beacons, subsets, metric)
+        for subset, rssi_norm, mcpd_norm in zip(subsets, rssi_norms, mcpd_norms):
+            entry_key = (key, tuple(b.n for b in subset), metric)
+            self._entries[entry_key] = (rssi_norm, mcpd_norm)
+            self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,235 @@
+from typing import List
+import numpy as np
+from numpy.linalg import norm
+from neighbors import build_index, k_nearest
+
+# Values of the metrics weighting each beacon by the variance of its measurements
+INVERSE_VARIANCE = "inverse-variance"
+MAHALANOBIS = "mahalanobis"
+WEIGHTED_METRICS = (INVERSE_VARIANCE, MAHALANOBIS)
+# Lower bound of the variances, so a beacon without measured spread does not dominate the distance
+MIN_VARIANCE = 1e-3
+
+
+class Fingerprint:
+    """Reference fingerprints as dense (positions x beacons) matrices
+
+    Rows follow the order in which the positions appear in the reference data,
+    columns follow the order of the beacon ids. If the variances of the
+    measurements are given, the weights of the variance-weighted metrics are
+    computed once here: the inverse variance pooled over all positions per
+    beacon, and the inverse variance per position and beacon (a diagonal
+    Mahalanobis distance).
+    """
+
+    def __init__(self, positions, beacon_ids, rssi, mcpd, rssi_var=None, mcpd_var=None, coordinates=None):
+        """
+        :param positions: reference position numbers, one per row
+        :param beacon_ids: beacon numbers (Beacon.n), one per column
+        :param rssi: array (positions x beacons) holding the average RSSI
+        :param mcpd: array (positions x beacons) holding the average MCPD (ifft)
+        :param rssi_var: array (positions x beacons) holding the variance of the RSSI, needed by the weighted metrics only
+        :param mcpd_var: array (positions x beacons) holding the variance of the MCPD (ifft), needed by the weighted metrics only
+        :param coordinates: array (positions x 2) holding the coordinates of the reference positions, if known
+
+        """
+        self.positions = np.asarray(positions)
+        self.beacon_ids = np.asarray(beacon_ids)
+        self.rssi = np.asarray(rssi, dtype=float)
+        self.mcpd = np.asarray(mcpd, dtype=float)
+        # Both modalities stacked (positions x beacons x [rssi, mcpd]), for the fused estimators
+        self.features = np.stack([self.rssi, self.mcpd], axis=-1)
+        self.index = {int(n): i for i, n in enumerate(self.beacon_ids)}
+        self.rssi_var = rssi_var
+        self.mcpd_var = mcpd_var
+        self.coordinates = None if coordinates is None else np.asarray(coordinates, dtype=float)
+        # metric value -> modality -> weights, (beacons) or (positions x beacons)
+        self._weights = {}
+        if rssi_var is not None and mcpd_var is not None:
+            variances = {"rssi": np.asarray(rssi_var, dtype=float), "mcpd": np.asarray(mcpd_var, dtype=float)}
+            # fmax also replaces the nan variance of a single measurement
+            self._weights[INVERSE_VARIANCE] = {m: 1 / np.fmax(np.nanmean(v, axis=0), MIN_VARIANCE) for m, v in variances.items()}
+            self._weights[MAHALANOBIS] = {m: 1 / np.fmax(v, MIN_VARIANCE) for m, v in variances.items()}
+        # (modality, columns, metric, backend, options) -> neighbor search
+        self._search = {}
+
+    @classmethod
+    def from_dataframe(cls, reference, points=None):
+        """Builds the fingerprint matrices out of a reference dataframe
+
+        :param reference: A Dataframe containing headers 'position', 'id', 'rssi', 'mcpd_ifft' (and optionally 'rssi_var', 'mcpd_ifft_var') - and exactly one row per beacon/id per reference position'
+        :param points: Dict[position] = Point, the coordinates of the reference positions (nan for positions missing)
+        :returns: Fingerprint
+
+        """
+        positions = reference["position"].unique()
+        beacon_ids = reference["id"].unique()
+        table = reference.pivot(index="position", columns="id")
+        (rssi, mcpd, rssi_var, mcpd_var) = (
+            table[c].reindex(index=positions, columns=beacon_ids).to_numpy() if c in reference else None
+            for c in ["rssi", "mcpd_ifft", "rssi_var", "mcpd_ifft_var"]
+        )
+        coordinates = None
+        if points is not None:
+            coordinates = np.array([[points[p].x, points[p].y] if p in points else [np.nan, np.nan] for p in positions.tolist()]).reshape(-1, 2)
+        return cls(positions, beacon_ids, rssi, mcpd, rssi_var, mcpd_var, coordinates)
+
+    def select(self, positions, beacon_ids) -> "Fingerprint":
+        """Extracts the fingerprint of some positions and beacons, e.g. the shard of one room
+
+        :param positions: reference position numbers to keep, missing ones are skipped
+        :param beacon_ids: beacon numbers (Beacon.n) to keep, missing ones are skipped
+        :returns: Fingerprint
+
+        """
+        wanted = set(int(p) for p in positions)
+        rows = [i for i, p in enumerate(self.positions.tolist()) if p in wanted]
+        cols = [self.index[int(n)] for n in beacon_ids if int(n) in self.index]
+        part = lambda values: None if values is None else np.asarray(values)[rows][:, cols]
+        return Fingerprint(
+            self.positions[rows],
+            self.beacon_ids[cols],
+            part(self.rssi),
+            part(self.mcpd),
+            part(self.rssi_var),
+            part(self.mcpd_var),
+            None if self.coordinates is None else self.coordinates[rows],
+        )
+
+    def columns(self, beacons) -> List[int]:
+        """Maps beacons onto the column indices of the fingerprint matrices
+
+        :param beacons: List of Beacon
+        :returns: list of column indices, in the order of beacons
+
+        """
+        try:
+            return [self.index[b.n] for b in beacons]
+        except KeyError as e:
+            raise ValueError("Beacon {} has no reference data".format(e.args[0]))
+
+    def weights(self, modality: str, metric, cols=None):
+        """Weights of the beacons for a variance-weighted metric
+
+        :param modality: "rssi" or "mcpd"
+        :param metric: Metric with a value in WEIGHTED_METRICS
+        :param cols: column indices to select, defaults to all
+        :returns: array (beacons) for the inverse variance, (positions x beacons) for the Mahalanobis distance
+
+        """
+        if metric.value not in self._weights:
+            raise ValueError("Metric {} needs the variances of the reference data, run test_validation_split.py again".format(metric))
+        weights = self._weights[metric.value][modality]
+        return weights if cols is None else weights[..., cols]
+
+    def _norm(self, modality: str, measurement, cols, metric):
+        diff = np.expand_dims(np.asarray(measurement, dtype=float), -2) - getattr(self, modality)[:, cols]
+        if metric.value in WEIGHTED_METRICS:
+            return np.sqrt((diff * diff * self.weights(modality, metric, cols)).sum(axis=-1))
+        return norm(diff, ord=metric.value, axis=-1)
+
+    def norm(self, rssi_m, mcpd_m, beacons, metric):
+        """Computes the norm from one or many measurements to all reference positions at once
+
+        :param rssi_m: RSSI of the measurement, one value per beacon in beacons - or an array (N x beacons) of N measurements
+        :param mcpd_m: MCPD of the measurement, one value per beacon in beacons - or an array (N x beacons) of N measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param metric: Desired norm, chebyshev, euclid or variance-weighted (enum)
+        :returns: (rssi_vector_norm, mcpd_vector_norm), both arrays with one entry per reference position (N x positions for N measurements)
+
+        """
+        cols = self.columns(beacons)
+        return (
+            self._norm("rssi", rssi_m, cols, metric),
+            self._norm("mcpd", mcpd_m, cols, metric),
+        )
+
+    def fused_norm(self, measurement, beacons, metric):
+        """Computes the norm of both modalities from one or many measurements to all reference positions in one pass
+
+        :param measurement: array (beacons x [rssi, mcpd]) - or (N x beacons x [rssi, mcpd]) for N measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param metric: Desired norm, chebyshev, euclid or variance-weighted (enum)
+        :returns: array (positions x [rssi, mcpd]) - (N x positions x [rssi, mcpd]) for N measurements
+
+        """
+        cols = self.columns(beacons)
+        diff = np.expand_dims(np.asarray(measurement, dtype=float), -3) - self.features[:, cols, :]
+        if metric.value in WEIGHTED_METRICS:
+            weights = np.stack([self.weights("rssi", metric, cols), self.weights("mcpd", metric, cols)], axis=-1)
+            return np.sqrt((diff * diff * weights).sum(axis=-2))
+        return norm(diff, ord=metric.value, axis=-2)
+
+    def subset_norms(self, rssi_m, mcpd_m, beacons, subsets, metric):
+        """Computes the norm from one or many measurements to all reference positions, for many subsets of beacons at once
+
+        The per-beacon differences are computed once. The euclidean norm of a subset
+        is the root of a sum of per-beacon squares (weighted for the variance-weighted
+        metrics), the chebyshev norm a maximum of per-beacon absolute values. Visiting the subsets in lexicographic order, each
+        subset extends the partial sum (or maximum) of its longest already visited
+        prefix, instead of reducing over all its beacons again.
+
+        :param rssi_m: RSSI of the measurement, one value per beacon in beacons - or an array (N x beacons) of N measurements
+        :param mcpd_m: MCPD of the measurement, one value per beacon in beacons - or an array (N x beacons) of N measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param subsets: List of subsets (lists of Beacon) of beacons
+        :param metric: Desired norm, chebyshev, euclid or variance-weighted (enum)
+        :returns: (rssi_vector_norm, mcpd_vector_norm), both arrays (subsets x positions) - (subsets x N x positions) for N measurements
+
+        """
+        position = {b.n: i for i, b in enumerate(beacons)}
+        members = [tuple(sorted(position[b.n] for b in subset)) for subset in subsets]
+        cols = self.columns(beacons)
+        return (
+            self._subset_norm("rssi", rssi_m, cols, members, metric),
+            self._subset_norm("mcpd", mcpd_m, cols, members, metric),
+        )
+
+    def _subset_norm(self, modality: str, measurement, cols, members, metric):
+        diff = np.abs(np.expand_dims(np.asarray(measurement, dtype=float), -2) - getattr(self, modality)[:, cols])
+        if metric.value is None:
+            (parts, combine) = (diff * diff, np.add)
+        elif metric.value in WEIGHTED_METRICS:
+            (parts, combine) = (diff * diff * self.weights(modality, metric, cols), np.add)
+        elif metric.value == np.inf:
+            (parts, combine) = (diff, np.maximum)
+        else:
+            raise ValueError("Metric {} can not be decomposed into beacons".format(metric))
+        # One contiguous (N x positions) block per beacon
+        parts = np.ascontiguousarray(np.moveaxis(parts, -1, 0))
+
+        result = np.empty((len(members),) + parts.shape[1:])
+        # Partial results of the prefixes of the current subset: [(prefix, array)]
+        stack = []
+        for i in sorted(range(len(members)), key=lambda i: members[i]):
+            cols = members[i]
+            while stack and stack[-1][0] != cols[:len(stack[-1][0])]:
+                stack.pop()
+            (prefix, acc) = stack[-1] if stack else ((), None)
+            for c in cols[len(prefix):]:
+                acc = parts[c] if acc is None else combine(acc, parts[c])
+                prefix = prefix + (c,)
+                stack.append((prefix, acc))
+            result[i] = acc
+        return result if metric.value == np.inf else np.sqrt(result)
+
+    def search(self, modality: str, queries, beacons, metric, k: int, backend: str = "auto", **options):
+        """Searches the k closest reference positions of each query, in a single modality
+
+        :param modality: "rssi" or "mcpd"
+        :param queries: array (N x beacons) of measurements
+        :param beacons: List of Beacon the measurement values belong to
+        :param metric: Desired norm, chebyshev, euclid or variance-weighted (enum)
+        :param k: k-closest Neighbors
+        :param backend: neighbor search backend, see neighbors.build_index - the variance-weighted metrics always scan all positions
+        :param options: options of the backend, e.g. clusters and probes of "clustered"
+        :returns: (indices, distances), both arrays (N x k) - indices are rows of the fingerprint matrices
+
+        """
+        cols = self.columns(beacons)
+        if metric.value in WEIGHTED_METRICS:
+            return k_nearest(self._norm(modality, np.atleast_2d(queries), cols, metric), k)
+        key = (modality, tuple(cols), metric, backend, tuple(sorted(options.items())))
+        if key not in self._search:
+            self._search[key] = build_index(getattr(self, modality)[:, cols], metric, backend, **options)
+        return self._search[key].query(np.atleast_2d(np.asarray(queries, dtype=float)), k)
@@ -0,0 +1,81 @@
+#!/bin/python
+from dataclasses import dataclass
+from typing import Iterable, List
+import argparse
+import itertools
+import time
+import pandas as pd
+from pytablewriter import MarkdownTableWriter
+import configs
+from cross_validation import Fold, SampleSet, evaluate_fold, k_fold, leave_one_position_out, load_samples
+from reference_store import ReferenceStore, default_store
+from wknn import Metric
+
+
+@dataclass
+class Grid:
+    """Hyperparameters to evaluate, every combination is one cell of the grid"""
+    ks: List[int]
+    metrics: List[Metric]
+    # Samples averaged per estimate
+    windows: List[int]
+    # Lists of Beacon
+    subsets: List[list]
+
+
+def validation_fold(store: ReferenceStore = None, beacons=None) -> Fold:
+    """The fixed split of test_validation_split.py as a single fold: the single measurements of the validation positions against the train averages"""
+    samples = load_samples(beacons, configs.room.validation_points, [configs.validation_set_path])
+    return Fold("validation", 0, 0, (store or default_store).fingerprint(), samples.positions, samples.values)
+
+
+def grid_search(grid: Grid, folds: Iterable[Fold] = None, beacons=None) -> pd.DataFrame:
+    """Evaluates every cell of the grid and ranks the cells
+
+    :param grid: Grid of hyperparameters
+    :param folds: Folds to evaluate on (see cross_validation), defaults to the fixed validation split
+    :param beacons: List of Beacon in the order of the measurement columns of the folds, defaults to the beacons of configs.room
+    :returns: A Dataframe with one row per cell: the mean error over all folds, the number of estimates and the latency per estimate in µs, ranked by error and latency
+
+    """
+    beacons = beacons or configs.room.beacons
+    folds = folds if folds is not None else [validation_fold(beacons=beacons)]
+    rows = []
+    for fold in folds:
+        rows += evaluate_fold(fold, beacons, grid.ks, grid.metrics, grid.windows, grid.subsets)
+    results = pd.DataFrame.from_records(rows)
+    results = results.assign(total_error=results["error"] * results["estimates"])
+    cells = results.groupby(["scheme", "window", "k", "metric", "beacons", "method"], sort=False)
+    ranked = cells[["total_error", "estimates", "latency"]].sum()
+    ranked["error"] = ranked["total_error"] / ranked["estimates"]
+    ranked["latency_us"] = ranked["latency"] / ranked["estimates"] * 1e6
+    ranked = ranked.drop(columns=["total_error", "latency"]).reset_index()
+    return ranked.sort_values(["error", "latency_us"], kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grid search over k, metric, averaging window and beacon subset")
+    parser.add_argument("-k", type=int, nargs="+", default=list(range(1, 8)), help="k-closest Neighbors")
+    parser.add_argument("-m", "--metrics", nargs="+", choices=[m.name for m in Metric], default=[Metric.EUCLID.name, Metric.CHEBYSHEV.name])
+    parser.add_argument("-w", "--windows", type=int, nargs="+", default=[1, 5, 15], help="Samples averaged per estimate")
+    parser.add_argument("-b", "--min-beacons", type=int, default=3, help="Smallest beacon subset to evaluate")
+    parser.add_argument("-s", "--scheme", choices=["validation", "lopo", "kfold"], default="validation", help="Fixed validation split, leave one position out or k-fold")
+    parser.add_argument("-f", "--folds", type=int, default=5, help="Folds of the k-fold")
+    parser.add_argument("-r", "--repeats", type=int, default=1, help="Repetitions of the k-fold")
+    parser.add_argument("-n", "--top", type=int, default=20, help="Rows to print")
+    args = parser.parse_args()
+
+    beacons = configs.room.beacons
+    subsets = [list(c) for i in range(args.min_beacons, len(beacons) + 1) for c in itertools.combinations(beacons, i)]
+    grid = Grid(ks=args.k, metrics=[Metric[m] for m in args.metrics], windows=args.windows, subsets=subsets)
+    folds = None
+    if args.scheme != "validation":
+        samples: SampleSet = load_samples(beacons)
+        folds = leave_one_position_out(samples) if args.scheme == "lopo" else k_fold(samples, args.folds, args.repeats)
+
+    start = time.perf_counter()
+    ranked = grid_search(grid, folds, beacons)
+    print("Evaluated {} cells in {:.2f} s".format(len(ranked), time.perf_counter() - start))
+    writer = MarkdownTableWriter(table_name="grid_search", margin=1)
+    writer.from_dataframe(ranked.head(args.top).round(decimals=3), add_index_column=False)
+    print(writer.dumps())
@@ -0,0 +1,190 @@
+from typing import Tuple
+import math
+import numpy as np
+from numpy.linalg import norm
+
+# Below this number of reference positions a linear scan beats building a tree
+BRUTE_FORCE_MAX_POSITIONS = 2000
+# KD-trees degrade with the dimensionality, ball trees less so
+KD_TREE_MAX_DIMENSIONS = 10
+# Above this dimensionality trees are no better than a linear scan
+TREE_MAX_DIMENSIONS = 30
+
+
+def k_nearest(distances, k: int):
+    """Selects the k smallest distances of each row, without sorting the full row
+
+    :param distances: array (N x positions)
+    :param k: k-closest Neighbors
+    :returns: (indices, distances), both arrays (N x k), sorted by ascending distance
+
+    """
+    n = distances.shape[-1]
+    # Candidates are all positions not further away than the k-th closest. On ties there are more than k of them,
+    # these are resolved by position order, like a stable sort over all positions would do
+    candidates = n
+    if k < n:
+        kth = np.partition(distances, k - 1, axis=-1)[..., k - 1:k]
+        candidates = int((distances <= kth).sum(axis=-1).max())
+    if candidates < n:
+        idx = np.argpartition(distances, candidates - 1, axis=-1)[..., :candidates]
+    else:
+        idx = np.broadcast_to(np.arange(n), distances.shape).copy()
+    dist = np.take_along_axis(distances, idx, axis=-1)
+    order = np.lexsort((idx, dist), axis=-1)[..., :k]
+    return (np.take_along_axis(idx, order, axis=-1), np.take_along_axis(dist, order, axis=-1))
+
+
+class BruteForce:
+    """Linear scan over all reference positions, using numpy broadcasting"""
+
+    def __init__(self, data, metric):
+        self.data = np.asarray(data, dtype=float)
+        self.metric = metric
+
+    def query(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Searches the k nearest reference positions of each query
+
+        :param queries: array (N x dimensions)
+        :param k: k-closest Neighbors
+        :returns: (indices, distances), both arrays (N x k), sorted by ascending distance
+
+        """
+        diff = np.expand_dims(np.asarray(queries, dtype=float), -2) - self.data
+        return k_nearest(norm(diff, ord=self.metric.value, axis=-1), k)
+
+
+class _Tree:
+    """Common wrapper of the scikit-learn trees"""
+
+    def __init__(self, tree, data, metric):
+        self.metric = metric
+        self.tree = tree(np.asarray(data, dtype=float), metric=sklearn_metric(metric))
+
+    def query(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        (dist, idx) = self.tree.query(np.atleast_2d(queries), k=min(k, self.tree.data.shape[0]))
+        return (idx, dist)
+
+
+class KDTree(_Tree):
+    """KD-tree search, suited for few beacons"""
+
+    def __init__(self, data, metric):
+        from sklearn.neighbors import KDTree as tree
+        super().__init__(tree, data, metric)
+
+
+class BallTree(_Tree):
+    """Ball tree search, suited for more beacons than a KD-tree handles well"""
+
+    def __init__(self, data, metric):
+        from sklearn.neighbors import BallTree as tree
+        super().__init__(tree, data, metric)
+
+
+class ClusteredSearch:
+    """Coarse-to-fine search for large radio maps
+
+    The reference positions are clustered with k-means once. A query is matched
+    against the cluster centroids first, then searched exactly among the members
+    of the probes closest clusters only. More probes trade speed for recall,
+    probing all clusters gives the exact result.
+    """
+
+    def __init__(self, data, metric, clusters: int = None, probes: int = 3, seed: int = 0):
+        """
+        :param data: array (positions x dimensions) of reference fingerprints
+        :param metric: Chebyshev or Euclidian norm (enum)
+        :param clusters: number of clusters, defaults to the square root of the number of positions
+        :param probes: number of clusters searched per query
+        :param seed: seed of the k-means initialization
+
+        """
+        from sklearn.cluster import KMeans
+        self.data = np.asarray(data, dtype=float)
+        self.metric = metric
+        self.probes = probes
+        n = self.data.shape[0]
+        clusters = min(clusters or max(1, round(math.sqrt(n))), n)
+        kmeans = KMeans(n_clusters=clusters, n_init=1, random_state=seed).fit(self.data)
+        self.centroids = kmeans.cluster_centers_
+        # Rows of the members of each cluster, ascending
+        self.members = [np.flatnonzero(kmeans.labels_ == c) for c in range(clusters)]
+
+    def query(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Searches the k nearest reference positions of each query, among the members of the closest clusters
+
+        :param queries: array (N x dimensions)
+        :param k: k-closest Neighbors
+        :returns: (indices, distances), both arrays (N x k), sorted by ascending distance
+
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=float))
+        k = min(k, self.data.shape[0])
+        centroid_distances = norm(np.expand_dims(queries, -2) - self.centroids, ord=self.metric.value, axis=-1)
+        (ranking, _) = k_nearest(centroid_distances, len(self.centroids))
+        idx = np.empty((len(queries), k), dtype=int)
+        dist = np.empty((len(queries), k))
+        for i, query in enumerate(queries):
+            # Probe further clusters if the closest ones hold less than k positions
+            probed = []
+            for c in ranking[i]:
+                probed.append(self.members[c])
+                if len(probed) >= self.probes and sum(map(len, probed)) >= k:
+                    break
+            candidates = np.sort(np.concatenate(probed))
+            (j, d) = k_nearest(norm(query - self.data[candidates], ord=self.metric.value, axis=-1)[None, :], k)
+            idx[i] = candidates[j[0]]
+            dist[i] = d[0]
+        return (idx, dist)
+
+
+BACKENDS = {
+    "brute": BruteForce,
+    "kd_tree": KDTree,
+    "ball_tree": BallTree,
+    "clustered": ClusteredSearch,
+}
+
+
+def sklearn_metric(metric) -> str:
+    """Maps a Metric onto the name scikit-learn uses for it"""
+    if metric.value is None:
+        return "euclidean"
+    elif metric.value == np.inf:
+        return "chebyshev"
+    raise ValueError("Metric {} is not supported by the tree backends".format(metric))
+
+
+def choose_backend(positions: int, dimensions: int) -> str:
+    """Chooses the neighbor search backend from the size of the fingerprint database
+
+    :param positions: number of reference positions
+    :param dimensions: number of beacons
+    :returns: key into BACKENDS
+
+    """
+    if positions <= BRUTE_FORCE_MAX_POSITIONS or dimensions > TREE_MAX_DIMENSIONS:
+        return "brute"
+    elif dimensions <= KD_TREE_MAX_DIMENSIONS:
+        return "kd_tree"
+    else:
+        return "ball_tree"
+
+
+def build_index(data, metric, backend: str = "auto", **options):
+    """Builds a neighbor search over the reference data
+
+    :param data: array (positions x dimensions) of reference fingerprints
+    :param metric: Chebyshev or Euclidian norm (enum)
+    :param backend: "brute", "kd_tree", "ball_tree", "clustered" or "auto" to choose from the size of data
+    :param options: passed on to the backend, e.g. clusters and probes of "clustered"
+    :returns: BruteForce, KDTree, BallTree or ClusteredSearch
+
+    """
+    data = np.asarray(data, dtype=float)
+    if backend == "auto":
+        backend = choose_backend(*data.shape)
+    if backend not in BACKENDS:
+        raise ValueError("Backend {} does not exist".format(backend))
+    return BACKENDS[backend](data, metric, **options)
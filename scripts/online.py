@@ -0,0 +1,133 @@
+#!/bin/python
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import argparse
+import math
+import sys
+import time
+import configs
+from configs import Point
+from artifact import FingerprintArtifact
+from uart import Record, parse_record
+from wknn import Metric
+from shards import ShardedFingerprint
+
+
+class SlidingWindow:
+    """The latest values of one quantity, with a running sum for O(1) averages"""
+
+    def __init__(self, size: int):
+        self.values = deque(maxlen=size)
+        self.sum = 0.0
+
+    def add(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            self.sum -= self.values[0]
+        self.values.append(value)
+        self.sum += value
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / len(self.values)
+
+
+@dataclass
+class Estimate:
+    rssi_estimation: Point
+    mcpd_estimation: Point
+    # Time in seconds from receiving the record until the estimate was available
+    latency: float
+    # Rooms searched for the estimate
+    rooms: List[str] = None
+
+
+class OnlineLocalizer:
+    """Estimates the position from a live stream of scanner records
+
+    Every beacon keeps a sliding window of its latest RSSI and MCPD values. The
+    beacons seen so far select the rooms to search (see shards.ShardedFingerprint),
+    as soon as every beacon of such a room has been seen, each new record yields
+    an estimate on the window averages.
+    """
+
+    def __init__(self, k: int, metric: Metric, beacons=None, window: int = 15, store=None, artifact: FingerprintArtifact = None):
+        """
+        :param k: k-closest Neighbors
+        :param metric: Chebyshev or Euclidian norm for computation
+        :param beacons: List of Beacon to use, defaults to all beacons of the site
+        :param window: Number of records per beacon averaged for an estimate
+        :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+        :param artifact: FingerprintArtifact holding the reference data and the site, used instead of store and configs.site
+
+        """
+        if artifact is not None:
+            (reference, site) = (artifact.fingerprint(), artifact.site)
+        else:
+            # The reference store needs pandas, the artifact does not
+            from reference_store import default_store
+            (reference, site) = ((store or default_store).fingerprint(), configs.site)
+        self.k = k
+        self.metric = metric
+        self.beacons = beacons or site.beacons
+        self.reference = ShardedFingerprint(reference, site, self.beacons)
+        self.rssi: Dict[str, SlidingWindow] = {b.uuid: SlidingWindow(window) for b in self.beacons}
+        self.mcpd: Dict[str, SlidingWindow] = {b.uuid: SlidingWindow(window) for b in self.beacons}
+
+    def add(self, record: Record, received: float = None) -> Optional[Estimate]:
+        """Adds a record to the windows and estimates the position if all beacons are available
+
+        :param record: Record as parsed from the scanner output
+        :param received: time.perf_counter() when the record arrived, defaults to now
+        :returns: Estimate, or None if the record was not used or not all beacons have been seen yet
+
+        """
+        received = time.perf_counter() if received is None else received
+        if record.state != "ok" or record.uuid not in self.rssi:
+            return None
+        # A nan would stay in the running sums of the windows for good
+        if not (math.isfinite(record.rssi) and math.isfinite(record.mcpd_ifft)):
+            return None
+        self.rssi[record.uuid].add(record.rssi)
+        self.mcpd[record.uuid].add(record.mcpd_ifft)
+
+        # Window averages of the beacons seen so far
+        seen = [b for b in self.beacons if len(self.rssi[b.uuid]) > 0]
+        rssi_m = {b.n: self.rssi[b.uuid].mean for b in seen}
+        mcpd_m = {b.n: self.mcpd[b.uuid].mean for b in seen}
+        estimate = self.reference.estimate(self.k, self.metric, rssi_m, mcpd_m)
+        if estimate is None:
+            return None
+        return Estimate(estimate.rssi_estimation, estimate.mcpd_estimation, time.perf_counter() - received, estimate.rooms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live wkNN localization on the scanner output")
+    parser.add_argument("device", nargs="?", default="-", help="Serial device, pipe or pty to read from (default: stdin)")
+    parser.add_argument("-k", type=int, default=3, help="k-closest Neighbors")
+    parser.add_argument("-m", "--metric", choices=[m.name for m in Metric], default=Metric.EUCLID.name)
+    parser.add_argument("-w", "--window", type=int, default=15, help="Records per beacon to average")
+    parser.add_argument("-a", "--artifact", nargs="?", const=configs.artifact_path, help="Read the reference data from a fingerprint artifact (see artifact.py) instead of results_avg.csv")
+    args = parser.parse_args()
+
+    artifact = FingerprintArtifact(args.artifact) if args.artifact else None
+    localizer = OnlineLocalizer(args.k, Metric[args.metric], window=args.window, artifact=artifact)
+    source = sys.stdin.buffer if args.device == "-" else open(args.device, "rb")
+    for raw in iter(source.readline, b""):
+        received = time.perf_counter()
+        record = parse_record(raw.decode("ascii", errors="replace"))
+        if record is None:
+            continue
+        estimate = localizer.add(record, received)
+        if estimate is not None:
+            print("{}: RSSI: ({:.2f}, {:.2f}), MCPD: ({:.2f}, {:.2f}), latency: {:.2f} ms".format(
+                "/".join(estimate.rooms),
+                estimate.rssi_estimation.x,
+                estimate.rssi_estimation.y,
+                estimate.mcpd_estimation.x,
+                estimate.mcpd_estimation.y,
+                estimate.latency * 1000,
+            ), flush=True)
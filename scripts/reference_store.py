@@ -0,0 +1,87 @@
+import os
+from typing import Dict, Tuple
+import pandas as pd
+import configs
+from fingerprint import Fingerprint
+
+
+class ReferenceStore:
+    """Keeps the average train, test and validation data in memory
+
+    Each results_avg.csv is parsed on first use only. Later accesses compare
+    the modification time and size of the file and re-read it only if it
+    changed on disk (e.g. after running test_validation_split.py again).
+    """
+
+    columns = ["position", "id", "rssi", "mcpd_ifft"]
+    # Kept if present, for the variance-weighted metrics
+    variance_columns = ["rssi_var", "mcpd_ifft_var"]
+
+    def __init__(self, train_set_path=None, test_set_path=None, validation_set_path=None):
+        """
+        :param train_set_path: directory of the train set, defaults to configs.train_set_path
+        :param test_set_path: directory of the test set, defaults to configs.test_set_path
+        :param validation_set_path: directory of the validation set, defaults to configs.validation_set_path
+
+        """
+        self.train_set_path = train_set_path or configs.train_set_path
+        self.test_set_path = test_set_path or configs.test_set_path
+        self.validation_set_path = validation_set_path or configs.validation_set_path
+        # file -> (stamp, dataframe, fingerprint)
+        self._cache: Dict[str, Tuple[Tuple[int, int], pd.DataFrame, Fingerprint]] = {}
+
+    def _load(self, path: str) -> Tuple[pd.DataFrame, Fingerprint]:
+        filename = "{}results_avg.csv".format(path)
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(filename)
+        if cached is None or cached[0] != stamp:
+            df = pd.read_csv(filename)
+            df = df[self.columns + [c for c in self.variance_columns if c in df]]
+            cached = (stamp, df, Fingerprint.from_dataframe(df, configs.site.train_points))
+            self._cache[filename] = cached
+        return (cached[1], cached[2])
+
+    @property
+    def train(self) -> pd.DataFrame:
+        return self._load(self.train_set_path)[0]
+
+    @property
+    def test(self) -> pd.DataFrame:
+        return self._load(self.test_set_path)[0]
+
+    @property
+    def validation(self) -> pd.DataFrame:
+        return self._load(self.validation_set_path)[0]
+
+    def fingerprint(self) -> Fingerprint:
+        """Returns the fingerprint matrices of the average trainings data"""
+        return self._load(self.train_set_path)[1]
+
+    def measurement(self, point: int) -> pd.DataFrame:
+        """Returns the average measurement of a point: test data for train points, validation data for validation points
+
+        :param point: integer, pointing to the number of the measurement position
+        :returns: A Dataframe containing headers 'position', 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id
+
+        """
+        if point in configs.site.validation_points:
+            df = self.validation
+        elif point in configs.site.train_points:
+            df = self.test
+        else:
+            raise ValueError("Point {} does not exist".format(point))
+        return df[df["position"] == point]
+
+    def preload(self):
+        """Reads the train, test and validation data now, e.g. before the store is handed to worker processes"""
+        for path in [self.train_set_path, self.test_set_path, self.validation_set_path]:
+            self._load(path)
+
+    def clear(self):
+        """Drops all cached data, forcing a re-read on next access"""
+        self._cache.clear()
+
+
+# Store shared by all estimations that are not given one explicitly
+default_store = ReferenceStore()
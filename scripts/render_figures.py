@@ -0,0 +1,224 @@
+#!/bin/python
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from math import ceil
+from typing import List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import os
+import matplotlib.pyplot as plt
+import seaborn as sns
+import pandas as pd
+import configs
+from results_store import ResultsStore, beacon_key
+from wknn import Metric
+
+# Columns of the estimates (see results_store.TABLES) the figures are drawn from: the "sample" estimates of the single
+# measurements and the "average" estimate of the average measurement of the validation points, using all beacons
+ESTIMATES_COLUMNS = ["k", "metric", "method", "position", "kind", "x", "y", "error"]
+
+COLORS = [(0, 0.4470, 0.7410), (0.8500, 0.3250, 0.0980), (0.9290, 0.6940, 0.1250), (0.4940, 0.1840, 0.5560), (0.4660, 0.6740, 0.1880), (0.3010, 0.7450, 0.9330), (0.6350, 0.0780, 0.1840)]
+
+
+@dataclass
+class Figure:
+    # "room", "estimates" or "histogram"
+    kind: str
+    k: int = 0
+    metric: Optional[Metric] = None
+    method: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        if self.kind == "room":
+            return "{}room_setup.svg".format(configs.figures_path)
+        prefix = "hist_" if self.kind == "histogram" else ""
+        return "{}{}k{}_{}_{}.svg".format(configs.figures_path, prefix, self.k, str(self.metric).lower(), self.method.lower())
+
+
+def text_style():
+    plt.rc('text', usetex=True)
+    plt.rcParams.update({
+        'mathtext.fontset': 'stix',
+        'font.family': 'STIXGeneral',
+        'font.size'   : 12,
+    })
+
+def plot_beautify(k, metric, method: str):
+    LIMIT_TOL = 0.5
+    limits = (configs.room.size.x, configs.room.size.y)
+
+    beacons = ([beacon.position.x for beacon in configs.room.beacons],[beacon.position.y for beacon in configs.room.beacons])
+    train = ([position.x for position in configs.room.train_points.values()],[position.y for position in configs.room.train_points.values()])
+
+    plt.figure(figsize=[configs.room.size.x*0.7, configs.room.size.y*0.7])
+    text_style()
+    plt.scatter(beacons[0], beacons[1], [75 for x in beacons[0]], marker='^', color='k')
+    plt.scatter(train[0], train[1], [75 for x in train[0]], marker='s', color=(0.5, 0.5, 0.5))
+    plt.xlim(0-LIMIT_TOL, limits[0]+LIMIT_TOL)
+    plt.ylim(0-LIMIT_TOL, limits[1]+LIMIT_TOL)
+    plt.xlabel("x-Coordinate in m")
+    plt.ylabel("y-Coordinate in m")
+
+    if metric == Metric.CHEBYSHEV:
+        metric = "\\infty"
+    else:
+        metric = "2"
+
+    if k == 0:
+        plt.title("\\textbf{{Room setup}}", y=1.1)
+    else:
+        plt.title("\\textbf{{{}-Results for wkNN with $k={}$, $||\\cdot||_{}$}}".format(method, k, metric), y=1.1)
+    plt.tight_layout()
+
+def plot_store(k, path: str):
+    if k == 0:
+        plt.legend(["Beacons","Train Pos.","Reference"], scatteryoffsets=[0.5,0.5,0.5], bbox_to_anchor=(0.5,1.1), ncol=3, columnspacing=0.5, handletextpad=-0.2, loc='upper center')
+        leg = plt.gca().get_legend()
+        leg.legendHandles[2].set_edgecolor('k')
+        leg.legendHandles[2].set_facecolor('#FFFFFF')
+    else:
+        plt.legend(["Beacons","Train Pos.","Ref.","Est.", "Avg. Est."], scatteryoffsets=[0.5,0.5,0.5,0.5,0.5], bbox_to_anchor=(0.5,1.1), ncol=5, columnspacing=0.4, handletextpad=-0.3, loc='upper center')
+        leg = plt.gca().get_legend()
+        for i in range(2,5):
+            leg.legendHandles[i].set_edgecolor('k')
+            leg.legendHandles[i].set_facecolor('#FFFFFF')
+    plt.savefig(path)
+    #plt.show()
+    plt.close('all')
+
+def histogram_boxplot(data, k, metric, method: str, path: str, xlim: List = [], bins = None):
+    text_style()
+    sns.set_theme()
+    sns.set_style("whitegrid")
+    sns.set_style({'mathtext.fontset': 'stix',
+        'font.family': 'STIXGeneral',
+        'font.size': 12,
+        'axes.edgecolor': 'black',
+        'axes.linewidth': 1})
+    sns.set_context(font_scale=2)
+    f, (ax_box, ax_hist) = plt.subplots(2, gridspec_kw={"height_ratios": (.15, .85)})
+    sns.boxplot(data, ax=ax_box, orient='h')
+    sns.histplot(data, ax=ax_hist, bins=bins, kde=True) if bins else sns.histplot(data, ax=ax_hist, kde=True, stat='density')
+    ax_box.set(yticks=[], xticks=[])
+    ax_hist.set(xlabel="Estimation error in m")
+    if len(xlim) != 0: ax_hist.set(xlim=xlim)
+    if len(xlim) != 0: ax_box.set(xlim=xlim)
+
+    if metric == Metric.CHEBYSHEV:
+        tit_metric = "\\infty"
+    else:
+        tit_metric = "2"
+    plt.suptitle("\\textbf{{{}-Error for wkNN with $k={}$, $||\\cdot||_{}$}}".format(method, k, tit_metric), y=0.95)
+    plt.tight_layout()
+    plt.savefig(path)
+    #plt.show()
+    plt.close('all')
+
+
+def render(figure: Figure, data: pd.DataFrame):
+    """Renders one figure, the work unit of the process pool
+
+    :param figure: Figure to render
+    :param data: estimates for the k, metric and method of the figure (empty for the room setup)
+
+    """
+    # Every figure starts from the default style, whatever the worker rendered before. Besides the rcParams
+    # seaborn also redefines the color codes ('k' and the like)
+    try:
+        with plt.rc_context():
+            _render(figure, data)
+    finally:
+        sns.set_color_codes("reset")
+
+
+def _render(figure: Figure, data: pd.DataFrame):
+    if figure.kind == "room":
+        plot_beautify(0, None, None)
+        for idx, p in enumerate(configs.room.validation_points.values()):
+            plt.scatter(p.x, p.y, 75, marker='*', color=COLORS[idx])
+        plot_store(0, figure.path)
+    elif figure.kind == "estimates":
+        plot_beautify(figure.k, figure.metric, figure.method)
+        for idx, (p, point) in enumerate(configs.room.validation_points.items()):
+            plt.scatter(point.x, point.y, 75, marker='*', color=COLORS[idx])
+            rows = data[data["position"] == p]
+            samples = rows[rows["kind"] == "sample"]
+            average = rows[rows["kind"] == "average"]
+            plt.scatter(samples["x"], samples["y"], 5, alpha=0.6, marker='o', color=COLORS[idx])
+            plt.scatter(average["x"], average["y"], 75, alpha=0.6, marker='o', color=COLORS[idx])
+        plot_store(figure.k, figure.path)
+    else:
+        error = data.loc[data["kind"] == "sample", "error"].to_numpy()
+        histogram_boxplot(error, figure.k, figure.metric, figure.method, figure.path, xlim=[0, ceil(error.max())], bins=20)
+
+
+def figures(estimates: pd.DataFrame) -> List[Tuple[Figure, pd.DataFrame]]:
+    """Lists all figures of the report with the estimates each one is drawn from
+
+    :param estimates: A Dataframe with the ESTIMATES_COLUMNS
+    :returns: List of (Figure, rows)
+
+    """
+    result = [(Figure("room"), estimates.iloc[:0])]
+    for (k, metric, method), rows in estimates.groupby(["k", "metric", "method"], sort=False):
+        for kind in ["estimates", "histogram"]:
+            result.append((Figure(kind, int(k), Metric[metric], method), rows))
+    return result
+
+
+def figure_hash(figure: Figure, data: pd.DataFrame, code: str) -> str:
+    """Hash of everything a figure is drawn from: its parameters, its rows, the room and the plotting code"""
+    h = hashlib.sha256()
+    h.update(json.dumps({**asdict(figure), "metric": str(figure.metric), "room": asdict(configs.room)}, sort_keys=True).encode())
+    h.update(data.to_csv(index=False).encode())
+    h.update(code.encode())
+    return h.hexdigest()
+
+
+def main(run: str = None, jobs: int = None, force: bool = False):
+    """Renders the figures of the report from the estimates of a run in the results store, in a process pool
+
+    The manifest (configs.figure_manifest_path) stores the hash of the inputs of
+    each figure. A figure is skipped if its hash is unchanged and its file exists.
+
+    :param run: id of the run of compute_results.py, defaults to the latest
+    :param jobs: number of worker processes (default: number of CPUs)
+    :param force: render all figures, ignoring the manifest
+
+    """
+    results = ResultsStore()
+    estimates = results.query("estimates", run=run or results.latest_run(), beacons=beacon_key(configs.room.beacons))
+    estimates = estimates.loc[estimates["position"].isin(list(configs.room.validation_points)), ESTIMATES_COLUMNS].reset_index(drop=True)
+    with open(__file__) as f:
+        code = f.read()
+
+    manifest = {}
+    if not force and os.path.exists(configs.figure_manifest_path):
+        with open(configs.figure_manifest_path) as f:
+            manifest = json.load(f)
+
+    (pending, hashes) = ([], {})
+    for figure, data in figures(estimates):
+        hashes[figure.path] = figure_hash(figure, data, code)
+        if manifest.get(figure.path) != hashes[figure.path] or not os.path.exists(figure.path):
+            pending.append((figure, data))
+
+    if pending:
+        os.makedirs(configs.figures_path, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # Raises the first error of a worker, the manifest then keeps the hashes of the last complete run
+            list(executor.map(render, *zip(*pending)))
+    with open(configs.figure_manifest_path, "w") as f:
+        json.dump(hashes, f, indent=2)
+    print("Rendered {} figures, unchanged {}".format(len(pending), len(hashes) - len(pending)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the figures of compute_results.py from the results store")
+    parser.add_argument("-r", "--run", default=None, help="Id of the run (default: the latest)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("-f", "--force", action="store_true", help="Render all figures, ignoring the manifest")
+    args = parser.parse_args()
+    main(args.run, args.jobs, args.force)
@@ -0,0 +1,87 @@
+#!/bin/python
+import argparse
+import numpy as np
+import pandas as pd
+from pytablewriter import MarkdownTableWriter
+from pytablewriter.style import Style
+from results_store import ResultsStore
+from wknn import Metric
+
+
+def stats_line(row, decimals: int = 3) -> str:
+    """One line of statistics of an aggregates row"""
+    return "{}, k={}, metric={}, Var: {:.{d}f}, Std: {:.{d}f}, Avg: {:.{d}f}, Max: {:.{d}f}, Min: {:.{d}f}".format(
+        row["method"], row["k"], Metric[row["metric"]], row["var"], row["std"], row["avg"], row["max"], row["min"], d=decimals)
+
+
+def average_tables(estimates: pd.DataFrame):
+    """Prints the errors of the estimates on the average measurements as one Markdown table per k and metric"""
+    print("# Estimation on the average of 15 measurements, calculating then stats")
+    averages = estimates[estimates["kind"] == "average"]
+    for (k, metric), rows in averages.groupby(["k", "metric"], sort=False):
+        errors = {method: r for method, r in rows.groupby("method", sort=False)}
+        idx = errors["RSSI"]["position"].tolist()
+        # Create dataframe with this informations
+        df = pd.DataFrame(data=[errors["RSSI"]["error"].tolist(), errors["MCPD"]["error"].tolist()], columns=idx).round(decimals=3)
+        df.insert(0, "Type", ["RSSI", "MCPD"])
+        # Write markdown table
+        writer = MarkdownTableWriter(
+            table_name="k{}_{}_error".format(k, Metric[metric]),
+            margin=1,
+        )
+        writer.from_dataframe(
+            df,
+            add_index_column=False,
+        )
+        writer.set_style(0, Style(font_weight="bold"))
+        # Print Markdown Table
+        print(writer.dumps())
+
+
+def print_report(results: ResultsStore, run: str):
+    """Prints the statistics of a run: per combination of beacons, the tables of the setup using all beacons, and the
+    statistics per number of beacons
+
+    :param results: ResultsStore holding the run
+    :param run: id of the run
+
+    """
+    aggregates = results.query("aggregates", run=run)
+    complete = aggregates["n_beacons"].max()
+    for beacons, rows in aggregates.groupby("beacons", sort=False):
+        print("# Beacons: " + beacons)
+        # Tables ONLY for all beacons
+        all_beacons = rows["n_beacons"].iloc[0] == complete
+        if all_beacons:
+            average_tables(results.query("estimates", run=run, beacons=beacons))
+        print("# Estimation each measurement, calculating then stats")
+        for _, row in rows.iterrows():
+            print(stats_line(row, 2 if all_beacons else 3))
+        print("")
+
+    for n, setups in aggregates.groupby("n_beacons", sort=True):
+        print("# Overall stats for {} Beacon setups:".format(n))
+        for (k, metric, method), rows in setups.groupby(["k", "metric", "method"], sort=False):
+            print(stats_line({
+                "method": method,
+                "k": k,
+                "metric": metric,
+                "var": np.mean(rows["var"].to_numpy()),
+                "std": np.mean(rows["std"].to_numpy()),
+                "avg": np.mean(rows["avg"].to_numpy()),
+                "max": rows["max"].max(),
+                "min": rows["min"].min(),
+            }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints the statistics of a run of compute_results.py from the results store")
+    parser.add_argument("-r", "--run", default=None, help="Id of the run (default: the latest)")
+    parser.add_argument("-l", "--list", action="store_true", help="List the ids of all runs")
+    args = parser.parse_args()
+
+    results = ResultsStore()
+    if args.list:
+        print("\n".join(results.runs()))
+    else:
+        print_report(results, args.run or results.latest_run())
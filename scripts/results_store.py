@@ -0,0 +1,157 @@
+from typing import Dict, List
+import os
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import configs
+from dataset import map_column, read_header, write_columns
+
+MAGIC = b"WKNNRES\x01"
+
+# Typed columns of each table, in storage order. String columns are stored as codes into a list of categories
+TABLES = {
+    # One row per estimate: the "average" estimate of the average measurement of a train or validation point,
+    # and the "sample" estimates of the single measurements of a validation point
+    "estimates": [
+        ("run", "str"),
+        ("beacons", "str"),
+        ("k", "<i4"),
+        ("metric", "str"),
+        ("method", "str"),
+        ("position", "<i4"),
+        ("kind", "str"),
+        ("x", "<f8"),
+        ("y", "<f8"),
+        ("error", "<f8"),
+    ],
+    # One row per beacon subset, k, metric and method: the statistics of the errors of the sample estimates
+    "aggregates": [
+        ("run", "str"),
+        ("beacons", "str"),
+        ("n_beacons", "<i4"),
+        ("k", "<i4"),
+        ("metric", "str"),
+        ("method", "str"),
+        ("estimates", "<i4"),
+        ("var", "<f8"),
+        ("std", "<f8"),
+        ("avg", "<f8"),
+        ("max", "<f8"),
+        ("min", "<f8"),
+    ],
+}
+# Columns a query can filter on
+KEYS = ["run", "beacons", "k", "metric", "method"]
+
+
+def beacon_key(beacons) -> str:
+    """Key of a beacon subset, e.g. '[1, 2, 3]'
+
+    :param beacons: List of Beacon or of beacon numbers (Beacon.n)
+
+    """
+    return str([int(getattr(b, "n", b)) for b in beacons])
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%S")
+
+
+class ResultsStore:
+    """Appendable columnar store of the evaluation results
+
+    Each table is a directory of segment files, one per append, in the layout of
+    dataset.write_columns. The header lists the runs of a segment, so a
+    query only maps the columns of segments holding a requested run. Appending
+    never rewrites existing segments, several processes can append at once.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: directory of the store, defaults to configs.results_store_path
+
+        """
+        self.path = path or configs.results_store_path
+
+    def _segments(self, table: str) -> List[str]:
+        directory = os.path.join(self.path, table)
+        if not os.path.isdir(directory):
+            return []
+        # Names start with the time of the append, so they sort in append order
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".col")]
+
+    def append(self, table: str, rows: pd.DataFrame):
+        """Appends rows to a table as a new segment
+
+        :param table: key into TABLES
+        :param rows: A Dataframe holding all columns of the table
+
+        """
+        (columns, categories) = ({}, {})
+        for name, dtype in TABLES[table]:
+            if dtype == "str":
+                (codes, values) = pd.factorize(rows[name].astype(str), sort=False)
+                columns[name] = np.ascontiguousarray(codes, dtype="<i4")
+                categories[name] = values.tolist()
+            else:
+                columns[name] = np.ascontiguousarray(rows[name].to_numpy(dtype=dtype))
+
+        header = {"version": 1, "table": table, "rows": len(rows), "runs": categories["run"], "categories": categories}
+        directory = os.path.join(self.path, table)
+        os.makedirs(directory, exist_ok=True)
+        # Queries never see a partly written segment
+        write_columns(os.path.join(directory, "{:020d}-{}.col".format(time.time_ns(), uuid.uuid4().hex[:8])), columns, header, MAGIC)
+
+    def _header(self, path: str) -> dict:
+        return read_header(path, MAGIC, "results segment")
+
+    def runs(self, table: str = "aggregates") -> List[str]:
+        """Ids of all runs of a table, in the order they were appended"""
+        runs: Dict[str, None] = {}
+        for path in self._segments(table):
+            runs.update(dict.fromkeys(self._header(path)["runs"]))
+        return list(runs)
+
+    def latest_run(self, table: str = "aggregates") -> str:
+        runs = self.runs(table)
+        if not runs:
+            raise ValueError("No results in {}, run compute_results.py first".format(self.path))
+        return runs[-1]
+
+    def query(self, table: str, **keys) -> pd.DataFrame:
+        """Reads the rows of a table matching all given keys
+
+        :param table: key into TABLES
+        :param keys: values of the KEYS columns to select, a single value or a list each (beacons as keys of beacon_key)
+        :returns: A Dataframe with the columns of the table, rows in the order they were appended
+
+        """
+        wanted = {}
+        for name, value in keys.items():
+            if name not in KEYS:
+                raise ValueError("Column {} is no key of the results".format(name))
+            wanted[name] = set(value) if isinstance(value, (list, tuple, set)) else {value}
+
+        frames = []
+        for path in self._segments(table):
+            header = self._header(path)
+            if "run" in wanted and not wanted["run"] & set(header["runs"]):
+                continue
+            # Segments written before write_columns have no shapes
+            columns = {c["name"]: map_column(path, {"shape": [header["rows"]], **c}) for c in header["columns"]}
+            mask = np.ones(header["rows"], dtype=bool)
+            for name, values in wanted.items():
+                if name in header["categories"]:
+                    codes = [i for i, c in enumerate(header["categories"][name]) if c in values]
+                    mask &= np.isin(columns[name], codes)
+                else:
+                    mask &= np.isin(columns[name], [int(v) for v in values])
+            frame = {}
+            for name, dtype in TABLES[table]:
+                values = np.asarray(columns[name][mask])
+                frame[name] = np.array(header["categories"][name], dtype=object)[values] if dtype == "str" else values
+            frames.append(pd.DataFrame(frame))
+        if not frames:
+            return pd.DataFrame({name: pd.Series(dtype=object if dtype == "str" else dtype) for name, dtype in TABLES[table]})
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import configs
+from configs import Point, Site
+from fingerprint import Fingerprint
+from neighbors import k_nearest
+from wknn import Metric, compute_estimation_batch, reference_coordinates
+
+
+def per_beacon(distances, beacons: int, metric: Metric):
+    """Scales distances over some number of beacons to the distance of a single beacon
+
+    The euclidean and variance-weighted norms are roots of sums over the beacons,
+    they become root mean squares. The chebyshev norm is a maximum over the
+    beacons and already on the scale of one beacon.
+
+    :param distances: array of distances
+    :param beacons: number of beacons the distances were computed on
+    :param metric: norm of the distances
+    :returns: array of distances
+
+    """
+    if metric == Metric.CHEBYSHEV:
+        return distances
+    return distances / np.sqrt(beacons)
+
+
+@dataclass
+class ShardEstimate:
+    # Rooms whose shards were searched
+    rooms: List[str]
+    rssi_estimation: Point
+    mcpd_estimation: Point
+    # Closest reference positions and their distances per beacon (see per_beacon), merged over the searched rooms
+    rssi_k_closest: Dict[int, float]
+    mcpd_k_closest: Dict[int, float]
+
+
+class ShardedFingerprint:
+    """The fingerprint of a site, split into one shard per room
+
+    Each shard holds the reference positions and beacons of one room. A query is
+    routed to the rooms holding the most of its visible beacons, only their
+    shards are searched, so the cost of a query depends on the size of a room
+    rather than on the size of the site.
+    """
+
+    def __init__(self, reference: Fingerprint, site: Site = None, beacons=None):
+        """
+        :param reference: Fingerprint of the whole site
+        :param site: Site defining the rooms, defaults to configs.site
+        :param beacons: List of Beacon to use, defaults to all beacons of the site
+
+        """
+        self.site = site or configs.site
+        allowed = None if beacons is None else set(b.n for b in beacons)
+        self.shards: Dict[str, Fingerprint] = {}
+        self.beacons: Dict[str, list] = {}
+        for name, room in self.site.rooms.items():
+            used = [b for b in room.beacons if b.n in reference.index and (allowed is None or b.n in allowed)]
+            shard = reference.select(list(room.train_points), [b.n for b in used])
+            # Rooms without reference data can not be searched
+            if len(shard.positions) == 0 or len(used) == 0:
+                continue
+            if shard.coordinates is None:
+                shard.coordinates = reference_coordinates(shard)
+            self.shards[name] = shard
+            self.beacons[name] = used
+
+    def route(self, visible) -> List[str]:
+        """Chooses the rooms to search from the visible beacons
+
+        :param visible: numbers (Beacon.n) of the beacons with a measurement
+        :returns: names of the rooms holding the most of the visible beacons, empty if no room holds any
+
+        """
+        visible = set(visible)
+        overlap = {name: sum(b.n in visible for b in beacons) for name, beacons in self.beacons.items()}
+        best = max(overlap.values(), default=0)
+        return [name for name, n in overlap.items() if n == best and n > 0]
+
+    def _search(self, rooms: List[str], visible, modality: str, values: Dict[int, float], metric: Metric, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # k closest per room, using its visible beacons, then the k closest of their union. Rooms may use different
+        # numbers of beacons, so the distances are brought to the scale of a single beacon before they are merged
+        (positions, distances, coordinates) = ([], [], [])
+        for name in rooms:
+            shard = self.shards[name]
+            beacons = [b for b in self.beacons[name] if b.n in visible]
+            (idx, dist) = shard.search(modality, [values[b.n] for b in beacons], beacons, metric, k)
+            positions.append(shard.positions[idx[0]])
+            distances.append(per_beacon(dist[0], len(beacons), metric))
+            coordinates.append(shard.coordinates[idx[0]])
+        (positions, distances, coordinates) = (np.concatenate(positions), np.concatenate(distances), np.concatenate(coordinates))
+        (order, _) = k_nearest(distances[None, :], k)
+        return (positions[order[0]], distances[order[0]], coordinates[order[0]])
+
+    def estimate(self, k: int, metric: Metric, rssi: Dict[int, float], mcpd: Dict[int, float], complete: bool = True) -> Optional[ShardEstimate]:
+        """Estimates the position from one measurement, searching only the shards of the routed rooms
+
+        :param k: k-closest Neighbors
+        :param metric: Chebyshev, Euclidian or variance-weighted norm for computation
+        :param rssi: Dict[beacon number] = RSSI of the visible beacons
+        :param mcpd: Dict[beacon number] = MCPD of the visible beacons
+        :param complete: search a room only if all its beacons are visible, otherwise its visible beacons are used
+        :returns: ShardEstimate, or None if no room could be searched
+
+        """
+        visible = set(rssi) & set(mcpd)
+        rooms = self.route(visible)
+        if complete:
+            rooms = [name for name in rooms if all(b.n in visible for b in self.beacons[name])]
+        if not rooms:
+            return None
+
+        results = {}
+        for modality, values in [("rssi", rssi), ("mcpd", mcpd)]:
+            (positions, distances, coordinates) = self._search(rooms, visible, modality, values, metric, k)
+            estimation = compute_estimation_batch(coordinates, np.arange(len(positions))[None, :], distances[None, :])[0]
+            results[modality] = (Point(*estimation.tolist()), dict(zip(positions.tolist(), distances.tolist())))
+        return ShardEstimate(
+            rooms=rooms,
+            rssi_estimation=results["rssi"][0],
+            mcpd_estimation=results["mcpd"][0],
+            rssi_k_closest=results["rssi"][1],
+            mcpd_k_closest=results["mcpd"][1],
+        )
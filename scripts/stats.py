@@ -0,0 +1,196 @@
+from collections import deque
+from typing import Dict, List
+import numpy as np
+
+# Scales the median absolute deviation to the standard deviation of normally distributed data
+MAD_SCALE = 1.4826
+
+
+class Welford:
+    """Running count, mean and variance, updated with single values or whole chunks
+
+    Chunks are merged with the parallel variant of Welford's algorithm (Chan et
+    al.), so the memory does not grow with the number of samples.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of the squared differences from the mean
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        m2 = float(((values - mean) ** 2).sum())
+        if self.count == 0:
+            (self.count, self.mean, self.m2) = (n, float(mean), m2)
+            return
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += float(delta * n / total)
+        self.m2 += m2 + float(delta ** 2 * self.count * n / total)
+        self.count = total
+
+    def add(self, value: float):
+        self.update([value])
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (ddof=1, like pandas), nan for less than two values"""
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+
+class P2Quantile:
+    """Streaming estimate of a quantile, using the P² algorithm of Jain and Chlamtac
+
+    Only five markers are kept, independent of the number of samples. Up to five
+    samples the quantile is exact.
+    """
+
+    def __init__(self, p: float = 0.5):
+        """
+        :param p: quantile to estimate, 0.5 for the median
+
+        """
+        self.p = p
+        self.count = 0
+        # Heights and positions of the markers
+        self.q: List[float] = []
+        self.n = [0, 1, 2, 3, 4]
+        # Desired positions of the markers and their increments
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increment = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, values):
+        for value in np.asarray(values, dtype=float).ravel().tolist():
+            self.add(value)
+
+    def add(self, x: float):
+        self.count += 1
+        q = self.q
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Find the cell of x, extending the extreme markers if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            self.n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increment[i]
+
+        # Move the middle markers towards their desired positions
+        n = self.n
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    @property
+    def value(self) -> float:
+        if self.count == 0:
+            return float("nan")
+        if self.count <= 5:
+            return float(np.quantile(self.q, self.p))
+        return self.q[2]
+
+
+class Hampel:
+    """Causal Hampel filter: replaces a value by the median of the preceding window if it deviates by more than
+    threshold scaled median absolute deviations from it
+
+    The window is carried over between chunks, the first window values pass unfiltered.
+    """
+
+    def __init__(self, window: int = 7, threshold: float = 3.0):
+        """
+        :param window: number of preceding values to compare against
+        :param threshold: allowed deviation, in (scaled) median absolute deviations
+
+        """
+        self.window = window
+        self.threshold = threshold
+        self.history = deque(maxlen=window)
+        self.replaced = 0
+
+    def filter(self, values) -> np.ndarray:
+        """Filters the next chunk of values
+
+        :param values: array of values, in order of measurement
+        :returns: array of the same length, outliers replaced
+
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        extended = np.concatenate([np.array(self.history, dtype=float), values])
+        # Values with a full window of predecessors, and their windows
+        start = self.window - len(self.history)
+        result = values.copy()
+        if len(extended) > self.window:
+            windows = np.lib.stride_tricks.sliding_window_view(extended, self.window)[:len(extended) - self.window]
+            median = np.median(windows, axis=1)
+            mad = MAD_SCALE * np.median(np.abs(windows - median[:, None]), axis=1)
+            checked = values[max(start, 0):]
+            outlier = np.abs(checked - median) > self.threshold * mad
+            result[max(start, 0):] = np.where(outlier, median, checked)
+            self.replaced += int(outlier.sum())
+        self.history.extend(values[-self.window:].tolist())
+        return result
+
+
+class SampleStats:
+    """Mean, variance and median of several measurement columns, in one pass over chunks of samples"""
+
+    def __init__(self, columns: List[str], hampel: Hampel = None):
+        """
+        :param columns: names of the measurement columns
+        :param hampel: Hampel filter applied to every column before the statistics (copied per column), None to keep all values
+
+        """
+        self.columns = columns
+        self.moments = {c: Welford() for c in columns}
+        self.medians = {c: P2Quantile(0.5) for c in columns}
+        self.filters = {c: Hampel(hampel.window, hampel.threshold) for c in columns} if hampel else {}
+
+    def update(self, chunk):
+        """Adds a chunk of samples
+
+        :param chunk: A Dataframe (or a mapping of arrays) containing the columns
+
+        """
+        for c in self.columns:
+            values = np.asarray(chunk[c], dtype=float)
+            if c in self.filters:
+                values = self.filters[c].filter(values)
+            self.moments[c].update(values)
+            self.medians[c].update(values)
+
+    def row(self) -> Dict[str, float]:
+        """The statistics as one flat row: the means under the column names, then '<column>_var' and '<column>_median'"""
+        return {
+            **{c: self.moments[c].mean for c in self.columns},
+            **{"{}_var".format(c): self.moments[c].variance for c in self.columns},
+            **{"{}_median".format(c): self.medians[c].value for c in self.columns},
+        }
@@ -0,0 +1,50 @@
+import math
+import numpy as np
+import pytest
+from artifact import FingerprintArtifact, write_artifact
+from configs import Beacon, Point, Room, Site
+from fingerprint import Fingerprint
+from online import OnlineLocalizer
+from uart import Record
+from wknn import Metric
+
+BEACONS = [Beacon("00:00:00:00:00:0{}".format(n), n, Point(x, y)) for n, (x, y) in enumerate([(0, 0), (4, 0), (0, 4)], start=1)]
+TRAIN_POINTS = {1: Point(1, 1), 2: Point(3, 1), 3: Point(1, 3), 4: Point(3, 3)}
+RSSI = np.array([[-50, -60, -60], [-60, -50, -65], [-60, -65, -50], [-65, -60, -60]], dtype=float)
+MCPD = np.array([[1.4, 3.2, 3.2], [3.2, 1.4, 4.2], [3.2, 4.2, 1.4], [4.2, 3.2, 3.2]])
+
+
+@pytest.fixture
+def localizer(tmp_path):
+    site = Site(rooms={"room": Room(BEACONS, Point(4, 4), TRAIN_POINTS, {})})
+    reference = Fingerprint(list(TRAIN_POINTS), [b.n for b in BEACONS], RSSI, MCPD, coordinates=[[p.x, p.y] for p in TRAIN_POINTS.values()])
+    path = str(tmp_path / "fingerprint.wkfp")
+    write_artifact(path, reference, site)
+    return OnlineLocalizer(3, Metric.EUCLID, window=5, artifact=FingerprintArtifact(path))
+
+
+def records(row: int, offset: float = 0.0, mcpd: float = None):
+    """One record per beacon with the reference values of a train position, shifted by offset"""
+    return [
+        Record(b.uuid, "ok", RSSI[row, i] + offset, MCPD[row, i] + offset if mcpd is None else mcpd, 0.0, 0.0, 0.0)
+        for i, b in enumerate(BEACONS)
+    ]
+
+
+def test_nan_record_does_not_poison_the_windows(localizer):
+    for record in records(0, offset=0.5) * 5:
+        localizer.add(record)
+    assert localizer.add(records(0, mcpd=math.nan)[0]) is None
+    for record in records(0, offset=0.5) * 5:
+        estimate = localizer.add(record)
+        assert estimate is not None
+        for point in [estimate.rssi_estimation, estimate.mcpd_estimation]:
+            assert math.isfinite(point.x) and math.isfinite(point.y)
+
+
+def test_reference_values_estimate_the_reference_position(localizer):
+    for record in records(1) * 5:
+        estimate = localizer.add(record)
+    # The distance to train point 2 is 0
+    for point in [estimate.rssi_estimation, estimate.mcpd_estimation]:
+        assert (point.x, point.y) == pytest.approx((TRAIN_POINTS[2].x, TRAIN_POINTS[2].y))
@@ -1,65 +1,187 @@
 #!/bin/python
+import argparse
+import json
+import os
 import numpy as np
 import pandas as pd
 import configs
 from sklearn.model_selection import train_test_split
-from typing import List
-
-# Data frame holding the average values for train and test data
-results_train = pd.DataFrame()
-results_test = pd.DataFrame()
-
-# For all trainings positions
-for f in configs.room.train_points:
-    # Read dataframe of this train position
-    df = pd.read_csv(
-        "{}{}.csv".format(configs.raw_data_path, f),
-        header=None,
-        names=configs.uart_columns,
-    )
-    # For each beacon
-    for b in configs.room.beacons:
+from typing import Dict, Iterator, List, Tuple
+from dataset import file_hash, load_dataset, write_dataset
+from uart import Quarantine, read_capture
+from stats import Hampel, SampleStats
+
+# Parameters of the split, a change invalidates all cached positions
+TRAIN_SIZE = 100
+RANDOM_STATE = 0
+# Hampel filter applied before averaging, (window, threshold) or None
+HAMPEL = None
+
+
+def read_raw_data(position: int) -> Iterator[pd.DataFrame]:
+    """Reads the raw data of a position in chunks, moving lines that are no valid measurement into the quarantine"""
+    with Quarantine("{}{}.csv".format(configs.quarantine_path, position)) as quarantine:
+        yield from read_capture("{}{}.csv".format(configs.raw_data_path, position), quarantine=quarantine)
+    skipped = {reason: n for reason, n in quarantine.counts.items() if n > 0}
+    if skipped:
+        print("Position {}: skipped {}".format(position, skipped))
+
+
+def with_position(df, position: int, beacon: int):
+    """Returns the measurement columns of df, prefixed with 'position' and 'id'"""
+    df = df.iloc[:,2:].copy()
+    df.insert(0, 'position', position)
+    df.insert(1, 'id', beacon)
+    return df
+
+
+def sample_stats() -> SampleStats:
+    """Accumulator of the mean, variance and median of all measurement columns, for one row of results_avg.csv"""
+    return SampleStats(configs.uart_columns[2:], Hampel(*HAMPEL) if HAMPEL else None)
+
+
+def average(df, position: int, beacon: int) -> Dict[str, float]:
+    """Calculates mean, variance and median of all measurement columns of df, as one row of results_avg.csv"""
+    stats = sample_stats()
+    stats.update(df)
+    return {"position": position, "id": beacon, **stats.row()}
+
+
+def split_train_position(f: int) -> Dict[str, Tuple[List[Dict[str, float]], List[pd.DataFrame]]]:
+    """Splits the raw data of a train position into train and test set, writing the csv of each beacon
+
+    The random split needs all measurements of a beacon at once, so the chunks
+    are only collected per beacon, never joined for the whole position.
+
+    :param f: number of the train position
+    :returns: Dict[set] = (averages, samples) for the sets "train" and "test"
+
+    """
+    sets = {"train": ([], []), "test": ([], [])}
+    beacons = configs.site.rooms[configs.site.room_of(f)].beacons
+    chunks: Dict[str, List[pd.DataFrame]] = {b.uuid: [] for b in beacons}
+    for chunk in read_raw_data(f):
+        for uuid, rows in chunks.items():
+            rows.append(chunk[chunk["uuid"] == uuid])
+    # For each beacon of the room of this position
+    for b in beacons:
         # Get data of this beacon
-        f_b = df[df["uuid"] == b.uuid].copy()
+        f_b = pd.concat(chunks.pop(b.uuid))
         # Split data: 100 for train, the rest for test
-        train, test = train_test_split(f_b, train_size=100, random_state=0)
+        train, test = train_test_split(f_b, train_size=TRAIN_SIZE, random_state=RANDOM_STATE)
         # Store in csv
         train.to_csv('{}position_{}_beacon_{}.csv'.format(configs.train_set_path, f, b.n), index=False)
         test.to_csv('{}position_{}_beacon_{}.csv'.format(configs.test_set_path, f, b.n), index=False)
-        # Calculate the average of all train data
-        avg_train = train.iloc[:,2:].mean().to_frame().T
-        avg_train.insert(0, 'position', f)
-        avg_train.insert(1, 'id', b.n)
-        results_train = pd.concat([results_train, avg_train])
-        # Calculate the average of all test data
-        avg_test = test.iloc[:,2:].mean().to_frame().T
-        avg_test.insert(0, 'position', f)
-        avg_test.insert(1, 'id', b.n)
-        results_test = pd.concat([results_test, avg_test])
-
-# Store all average results for this position for train and test set
-results_train.to_csv('{}results_avg.csv'.format(configs.train_set_path), index=False)
-results_test.to_csv('{}results_avg.csv'.format(configs.test_set_path), index=False)
-
-# Data frame holding the average values for validation data
-results_validation = pd.DataFrame()
-for f in configs.room.validation_points:
-    # Read validation data for this position
-    df = pd.read_csv(
-        "{}{}.csv".format(configs.raw_data_path, f),
-        header=None,
-        names=configs.uart_columns,
-    )
-    # For each beacon
-    for b in configs.room.beacons:
-        # Store in csv
-        f_b = df[df["uuid"] == b.uuid].copy()
-        f_b.to_csv('{}position_{}_beacon_{}.csv'.format(configs.validation_set_path, f, b.n), index=False)
-        # Calculate the average of all validation data
-        avg_validation = f_b.iloc[:,2:].mean().to_frame().T
-        avg_validation.insert(0, 'position', f)
-        avg_validation.insert(1, 'id', b.n)
-        results_validation = pd.concat([results_validation, avg_validation])
-
-# Store all average results for this position for validation set
-results_validation.to_csv('{}results_avg.csv'.format(configs.validation_set_path), index=False)
+        # Calculate the average of all train and test data
+        for name, data in [("train", train), ("test", test)]:
+            sets[name][0].append(average(data, f, b.n))
+            sets[name][1].append(with_position(data, f, b.n))
+    return sets
+
+
+def split_validation_position(f: int) -> Dict[str, Tuple[List[Dict[str, float]], List[pd.DataFrame]]]:
+    """Writes the csv of each beacon of a validation position, streaming the chunks of the raw data into the statistics
+
+    :param f: number of the validation position
+    :returns: Dict[set] = (averages, samples) for the set "validation"
+
+    """
+    sets = {"validation": ([], [])}
+    beacons = configs.site.rooms[configs.site.room_of(f)].beacons
+    paths = {b.uuid: '{}position_{}_beacon_{}.csv'.format(configs.validation_set_path, f, b.n) for b in beacons}
+    stats = {b.uuid: sample_stats() for b in beacons}
+    chunks = 0
+    for chunk in read_raw_data(f):
+        # For each beacon of the room of this position
+        for b in beacons:
+            f_b = chunk[chunk["uuid"] == b.uuid]
+            # Store in csv, the first chunk replaces the file and writes the header
+            f_b.to_csv(paths[b.uuid], index=False, mode="a" if chunks else "w", header=chunks == 0)
+            if len(f_b):
+                stats[b.uuid].update(f_b)
+                sets["validation"][1].append(with_position(f_b, f, b.n))
+        chunks += 1
+    if chunks == 0:
+        for b in beacons:
+            pd.DataFrame(columns=configs.uart_columns).to_csv(paths[b.uuid], index=False)
+    # Calculate the average of all validation data
+    sets["validation"][0].extend({"position": f, "id": b.n, **stats[b.uuid].row()} for b in beacons)
+    return sets
+
+
+def split_parameters() -> dict:
+    """Everything besides the raw data that the split output depends on"""
+    return {
+        "train_size": TRAIN_SIZE,
+        "random_state": RANDOM_STATE,
+        "hampel": HAMPEL,
+        "beacons": [[b.uuid, b.n] for b in configs.site.beacons],
+        "columns": configs.uart_columns,
+    }
+
+
+def main(force: bool = False):
+    """Splits the raw data of all positions, reprocessing only positions whose raw data changed
+
+    The manifest (configs.split_manifest_path) stores the hash of each raw file
+    and the averages computed from it. A position is reused if its hash and the
+    split parameters are unchanged and the dataset files are present, its single
+    measurements are then taken from the existing dataset files.
+
+    :param force: reprocess all positions
+
+    """
+    set_paths = {
+        "train": configs.train_set_path,
+        "test": configs.test_set_path,
+        "validation": configs.validation_set_path,
+    }
+    datasets = {name: '{}{}'.format(path, configs.dataset_filename) for name, path in set_paths.items()}
+
+    manifest = {}
+    if not force and os.path.exists(configs.split_manifest_path):
+        with open(configs.split_manifest_path) as f:
+            manifest = json.load(f)
+    if manifest.get("parameters") != split_parameters() or not all(os.path.exists(d) for d in datasets.values()):
+        manifest = {}
+    cached = manifest.get("positions", {})
+
+    positions = {}
+    # Single measurements per set: new ones as dataframes, reused ones as positions to take from the dataset file
+    samples: Dict[str, List[pd.DataFrame]] = {name: [] for name in set_paths}
+    reused: Dict[str, List[int]] = {name: [] for name in set_paths}
+    for f, split in [(f, split_train_position) for f in configs.site.train_points] + [(f, split_validation_position) for f in configs.site.validation_points]:
+        h = file_hash("{}{}.csv".format(configs.raw_data_path, f))
+        entry = cached.get(str(f))
+        if entry is not None and entry["hash"] == h and entry["kind"] == split.__name__:
+            for name in entry["averages"]:
+                reused[name].append(f)
+        else:
+            sets = split(f)
+            entry = {"hash": h, "kind": split.__name__, "averages": {name: averages for name, (averages, _) in sets.items()}}
+            for name, (_, s) in sets.items():
+                samples[name].extend(s)
+        positions[str(f)] = entry
+
+    # Rebuild the aggregates of each set in one pass
+    for name, path in set_paths.items():
+        averages = [row for entry in positions.values() for row in entry["averages"].get(name, [])]
+        pd.DataFrame.from_records(averages).to_csv('{}results_avg.csv'.format(path), index=False)
+        if reused[name]:
+            old = load_dataset(datasets[name]).to_dataframe()
+            samples[name].append(old[old["position"].isin(reused[name])])
+        write_dataset(pd.concat(samples[name]), datasets[name])
+
+    with open(configs.split_manifest_path, "w") as f:
+        json.dump({"parameters": split_parameters(), "positions": positions}, f)
+    print("Processed {} positions, reused {}".format(len(positions) - len(set(sum(reused.values(), []))), len(set(sum(reused.values(), [])))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Splits the raw data into train, test and validation set")
+    parser.add_argument("-f", "--force", action="store_true", help="Reprocess all positions, ignoring the manifest")
+    parser.add_argument("--hampel", type=float, nargs=2, metavar=("WINDOW", "THRESHOLD"), help="Replace outliers with a Hampel filter before averaging")
+    args = parser.parse_args()
+    if args.hampel:
+        HAMPEL = (int(args.hampel[0]), args.hampel[1])
+    main(args.force)
@@ -0,0 +1,264 @@
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, IO, Iterator, List, Optional
+import itertools
+import math
+import os
+import re
+import threading
+import time
+import configs
+
+# pandas is imported by the batch parsers only, so parse_record stays cheap to import
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Pattern of a beacon address as printed by the scanner
+MAC = r"[0-9A-F]{2}(?::[0-9A-F]{2}){5}"
+# The RSSI is a signed byte in dBm
+RSSI_RANGE = (-128, 127)
+
+
+@dataclass
+class Record:
+    uuid: str
+    state: str
+    rssi: float
+    mcpd_ifft: float
+    mcpd_phase_slope: float
+    mcpd_rssi_openspace: float
+    best: float
+
+
+def parse_record(line: str, states=("ok",)) -> Optional[Record]:
+    """Parses a single line of the scanner output, with the same checks as parse_lines
+
+    :param line: One line in the configs.uart_columns layout
+    :param states: states to keep
+    :returns: Record, or None if the line is not a valid measurement (e.g. "Reset", a non-finite value or another state)
+
+    """
+    fields = line.strip().split(",")
+    if len(fields) != len(configs.uart_columns) or not re.fullmatch(MAC, fields[0]) or fields[1] not in states:
+        return None
+    try:
+        values = [float(f) for f in fields[2:]]
+    except ValueError:
+        return None
+    if not all(math.isfinite(v) for v in values) or values[0] % 1 != 0 or not RSSI_RANGE[0] <= values[0] <= RSSI_RANGE[1]:
+        return None
+    return Record(fields[0], fields[1], *values)
+
+
+class Quarantine:
+    """Collects the lines of a capture that are not used as measurements
+
+    Lines are counted per reason ("malformed", "unknown_beacon", "state") and,
+    if a file is given, appended to it as "reason,line".
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.counts: Counter = Counter()
+        self._file = None
+
+    def add(self, reason: str, lines):
+        lines = list(lines)
+        if not lines:
+            return
+        self.counts[reason] += len(lines)
+        if self.path is not None and lines:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "w")
+            self._file.writelines("{},{}\n".format(reason, line) for line in lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_lines(lines: List[str], beacons=None, states=("ok",), quarantine: Quarantine = None) -> pd.DataFrame:
+    """Parses lines of the scanner output at once, skipping everything that is not a valid record
+
+    Valid records have exactly the configs.uart_columns fields, a beacon address of
+    beacons, a state in states and finite numeric values, the RSSI an integer in
+    RSSI_RANGE. Empty lines are dropped silently, all other lines go to quarantine.
+
+    :param lines: raw lines
+    :param beacons: List of Beacon to keep, defaults to all beacons of the site
+    :param states: states to keep
+    :param quarantine: Quarantine receiving the skipped lines
+    :returns: A Dataframe with the configs.uart_columns: 'uuid' and 'state' categorical, 'rssi' int16 and float64 values
+
+    """
+    import numpy as np
+    import pandas as pd
+    beacons = beacons or configs.site.beacons
+    quarantine = quarantine if quarantine is not None else Quarantine()
+    lines = pd.Series(lines, dtype=object).str.strip()
+    lines = lines[lines != ""]
+
+    fields = lines.str.split(",", expand=True).reindex(columns=range(len(configs.uart_columns)))
+    values = fields.iloc[:, 2:].apply(pd.to_numeric, errors="coerce")
+    valid = (
+        (lines.str.count(",") == len(configs.uart_columns) - 1)
+        & fields[0].astype(object).str.fullmatch(MAC).fillna(False).astype(bool)
+        & np.isfinite(values).all(axis=1)
+        & (values[2] % 1 == 0)
+        & values[2].between(*RSSI_RANGE)
+    )
+    quarantine.add("malformed", lines[~valid])
+
+    known = valid & fields[0].isin([b.uuid for b in beacons])
+    quarantine.add("unknown_beacon", lines[valid & ~known])
+    keep = known & fields[1].isin(states)
+    quarantine.add("state", lines[known & ~keep])
+
+    df = pd.DataFrame({
+        "uuid": pd.Categorical(fields.loc[keep, 0], categories=[b.uuid for b in beacons]),
+        "state": pd.Categorical(fields.loc[keep, 1], categories=list(states)),
+        "rssi": values.loc[keep, 2].astype("int16"),
+    })
+    for i, column in enumerate(configs.uart_columns[3:], start=3):
+        df[column] = values.loc[keep, i].astype("float64")
+    return df.reset_index(drop=True)
+
+
+def read_capture(path: str, beacons=None, states=("ok",), quarantine: Quarantine = None, chunksize: int = 1000000) -> Iterator[pd.DataFrame]:
+    """Reads a capture in chunks of lines, so memory stays bounded for any file size
+
+    :param path: capture file, as written by data_collection.py
+    :param chunksize: number of lines per chunk
+    :returns: iterator over the parsed chunks, see parse_lines
+
+    """
+    with open(path, encoding="ascii", errors="replace") as f:
+        while True:
+            lines = list(itertools.islice(f, chunksize))
+            if not lines:
+                break
+            yield parse_lines(lines, beacons, states, quarantine)
+
+
+def load_capture(path: str, beacons=None, states=("ok",), quarantine: Quarantine = None, chunksize: int = 1000000) -> pd.DataFrame:
+    """Reads a whole capture into one Dataframe, see read_capture"""
+    import pandas as pd
+    chunks = list(read_capture(path, beacons, states, quarantine, chunksize))
+    if not chunks:
+        return parse_lines([], beacons, states, quarantine)
+    return pd.concat(chunks, ignore_index=True)
+
+
+@dataclass
+class BeaconStats:
+    """Number of records and running averages of a single beacon"""
+    count: int = 0
+    rssi: float = 0.0
+    mcpd_ifft: float = 0.0
+
+    def add(self, record: Record):
+        self.count += 1
+        self.rssi += (record.rssi - self.rssi) / self.count
+        self.mcpd_ifft += (record.mcpd_ifft - self.mcpd_ifft) / self.count
+
+
+class UartIngest:
+    """Reads the scanner output line by line and keeps per-beacon statistics in memory
+
+    The raw lines are appended unchanged to the output file, in batches, so the
+    file has the same content as with `cat /dev/ttyACM0 >> file`.
+    """
+
+    def __init__(self, output: IO[str], batch_size: int = 100, flush_interval: float = 1.0):
+        """
+        :param output: Text file the raw lines are written to
+        :param batch_size: Number of lines collected before they are written
+        :param flush_interval: Maximum time in seconds a line is kept in memory before it is written
+
+        """
+        self.output = output
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats: Dict[str, BeaconStats] = {b.uuid: BeaconStats() for b in configs.site.beacons}
+        self.lines = 0
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def feed(self, line: str) -> Optional[Record]:
+        """Processes one line of the scanner output
+
+        :param line: raw line, including the line ending
+        :returns: the parsed Record, or None if the line is not a measurement
+
+        """
+        record = self.update(line)
+        with self._lock:
+            self.lines += 1
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+        return record
+
+    def update(self, line: str) -> Optional[Record]:
+        """Updates the statistics with one line, without writing it (e.g. for lines already in the output file)
+
+        :param line: raw line
+        :returns: the parsed Record, or None if the line is not a measurement
+
+        """
+        record = parse_record(line)
+        if record is not None:
+            self.stats.setdefault(record.uuid, BeaconStats()).add(record)
+        return record
+
+    def flush(self):
+        """Writes all buffered lines to the output file"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.output.writelines(self._buffer)
+            self.output.flush()
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def consume(self, source: IO[bytes], stop: threading.Event = None):
+        """Feeds all lines of source until it is exhausted or stop is set
+
+        :param source: binary file-like object, e.g. an opened serial device, a pipe or a pty
+        :param stop: Event to end the reading
+
+        """
+        for raw in iter(source.readline, b""):
+            self.feed(raw.decode("ascii", errors="replace"))
+            if stop is not None and stop.is_set():
+                break
+        self.flush()
+
+    def run(self, device: str, stop: threading.Event, retry_interval: float = 0.1):
+        """Reads from device until stop is set, reopening it whenever it disappears (e.g. on a board reset)
+
+        :param device: path to the serial device, pipe or pty
+        :param stop: Event to end the reading
+        :param retry_interval: time in seconds between two attempts to open the device
+
+        """
+        while not stop.is_set():
+            try:
+                with open(device, "rb") as source:
+                    self.consume(source, stop)
+            except OSError:
+                pass
+            self.flush()
+            stop.wait(retry_interval)
@@ -1,23 +1,50 @@
-from typing_extensions import Self
+from __future__ import annotations
 from configs import Point
 from dataclasses import dataclass, field
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, Dict, List, Union
 from numpy import infty, mean
-from numpy.linalg import norm
+import numpy as np
+from fingerprint import Fingerprint, INVERSE_VARIANCE, MAHALANOBIS
+from neighbors import k_nearest
 import configs
-import pandas as pd
 from enum import Enum
 
+# Only needed for the annotations: the reference store pulls in pandas, which the online estimation does without
+if TYPE_CHECKING:
+    from typing_extensions import Self
+    from reference_store import ReferenceStore
+    from distance_cache import DistanceCache
+
+# Lower bound of the distances weighted by compute_estimation_batch: a reference at distance 0 then takes (almost) all
+# the weight, instead of an infinite weight making the estimate nan
+MIN_DISTANCE = 1e-12
+
+
+def _store(store: ReferenceStore = None) -> ReferenceStore:
+    """The given store, or reference_store.default_store (imported on first use)"""
+    if store is not None:
+        return store
+    from reference_store import default_store
+    return default_store
+
 
 class Metric(Enum):
     CHEBYSHEV = infty
     EUCLID = None
+    # Euclidian norm, each beacon weighted by the inverse of its variance (pooled over all positions)
+    INVERSE_VARIANCE = INVERSE_VARIANCE
+    # Euclidian norm, each beacon weighted by the inverse of its variance at the reference position
+    MAHALANOBIS = MAHALANOBIS
 
     def __str__(self):
         if self == Metric.CHEBYSHEV:
             return "CHEBYSHEV-norm"
         elif self == Metric.EUCLID:
             return "EUCLIDIAN-norm"
+        elif self == Metric.INVERSE_VARIANCE:
+            return "INVERSE-VARIANCE-norm"
+        elif self == Metric.MAHALANOBIS:
+            return "MAHALANOBIS-norm"
 
 
 @dataclass
@@ -34,9 +61,11 @@ class Result:
     mcpd_k_closest: Dict[int, float] = field(default_factory=lambda: dict())
 
     @classmethod
-    def average(cls, values: List[Self]) -> Self:
+    def average(cls, values: Union[List[Self], "BatchResult"]) -> Self:
         if len(values) == 0:
             raise ValueError("List cannot be empty")
+        if isinstance(values, BatchResult):
+            return values.average()
         idx = values[0].idx
         metric = values[0].metric
         k = values[0].k
@@ -72,94 +101,300 @@ class Result:
         )
 
 
+@dataclass
+class BatchResult:
+    """Results for N measurements, stored as arrays (one row per measurement)
+
+    Compact replacement of a list of Result: indexing and iterating yield Result
+    objects, which are only created on access.
+    """
+    idx: np.ndarray
+    metric: Metric
+    k: int
+    position: np.ndarray
+    rssi_estimation: np.ndarray
+    mcpd_estimation: np.ndarray
+    rssi_euc_error: np.ndarray
+    mcpd_euc_error: np.ndarray
+    rssi_k_closest: np.ndarray
+    mcpd_k_closest: np.ndarray
+    rssi_k_distance: np.ndarray
+    mcpd_k_distance: np.ndarray
+
+    def __len__(self):
+        return len(self.idx)
+
+    def __getitem__(self, i: int) -> Result:
+        return Result(
+            idx=int(self.idx[i]),
+            metric=self.metric,
+            k=self.k,
+            position=Point(*self.position[i].tolist()),
+            rssi_k_closest=dict(zip(self.rssi_k_closest[i].tolist(), self.rssi_k_distance[i].tolist())),
+            mcpd_k_closest=dict(zip(self.mcpd_k_closest[i].tolist(), self.mcpd_k_distance[i].tolist())),
+            rssi_estimation=Point(*self.rssi_estimation[i].tolist()),
+            rssi_euc_error=float(self.rssi_euc_error[i]),
+            mcpd_estimation=Point(*self.mcpd_estimation[i].tolist()),
+            mcpd_euc_error=float(self.mcpd_euc_error[i]),
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def to_results(self) -> List[Result]:
+        """Converts the arrays into one Result per measurement"""
+        return list(self)
+
+    def average(self) -> Result:
+        """Vectorized counterpart of Result.average, averaging estimations and errors over all rows"""
+        if len(self) == 0:
+            raise ValueError("List cannot be empty")
+        return Result(
+            int(self.idx[0]),
+            self.metric,
+            self.k,
+            Point(*self.position[0].tolist()),
+            Point(float(self.rssi_estimation[:, 0].mean()), float(self.rssi_estimation[:, 1].mean())),
+            Point(float(self.mcpd_estimation[:, 0].mean()), float(self.mcpd_estimation[:, 1].mean())),
+            float(self.rssi_euc_error.mean()),
+            float(self.mcpd_euc_error.mean()),
+        )
+
+    @classmethod
+    def from_results(cls, results: List[Result]) -> Self:
+        """Packs Result objects (of the same metric and k) into arrays
+
+        :param results: non-empty List of Result
+        :returns: BatchResult
+
+        """
+        if len(results) == 0:
+            raise ValueError("List cannot be empty")
+        return cls(
+            idx=np.array([r.idx for r in results]),
+            metric=results[0].metric,
+            k=results[0].k,
+            position=np.array([[r.position.x, r.position.y] for r in results], dtype=float),
+            rssi_estimation=np.array([[r.rssi_estimation.x, r.rssi_estimation.y] for r in results], dtype=float),
+            mcpd_estimation=np.array([[r.mcpd_estimation.x, r.mcpd_estimation.y] for r in results], dtype=float),
+            rssi_euc_error=np.array([r.rssi_euc_error for r in results], dtype=float),
+            mcpd_euc_error=np.array([r.mcpd_euc_error for r in results], dtype=float),
+            rssi_k_closest=np.array([list(r.rssi_k_closest.keys()) for r in results]),
+            mcpd_k_closest=np.array([list(r.mcpd_k_closest.keys()) for r in results]),
+            rssi_k_distance=np.array([list(r.rssi_k_closest.values()) for r in results], dtype=float),
+            mcpd_k_distance=np.array([list(r.mcpd_k_closest.values()) for r in results], dtype=float),
+        )
+
+    @classmethod
+    def concatenate(cls, batches: List[Self]) -> Self:
+        """Joins the rows of several BatchResult (of the same metric and k)"""
+        if len(batches) == 0:
+            raise ValueError("List cannot be empty")
+        return cls(
+            idx=np.concatenate([b.idx for b in batches]),
+            metric=batches[0].metric,
+            k=batches[0].k,
+            **{
+                name: np.concatenate([getattr(b, name) for b in batches])
+                for name in ["position", "rssi_estimation", "mcpd_estimation", "rssi_euc_error", "mcpd_euc_error",
+                             "rssi_k_closest", "mcpd_k_closest", "rssi_k_distance", "mcpd_k_distance"]
+            },
+        )
+
+
+@dataclass
+class FusedBatchResult(BatchResult):
+    """BatchResult extended by the estimators combining RSSI and MCPD
+
+    fused: wkNN on the weighted sum of the normalized RSSI and MCPD distances
+    gated: wkNN on the RSSI distances, among the reference positions closest in MCPD only
+    """
+    fused_estimation: np.ndarray
+    gated_estimation: np.ndarray
+    fused_euc_error: np.ndarray
+    gated_euc_error: np.ndarray
+    fused_k_closest: np.ndarray
+    gated_k_closest: np.ndarray
+    fused_k_distance: np.ndarray
+    gated_k_distance: np.ndarray
+
+
 def get_norm(measurement, reference, beacons, metric: Metric):
     """Computes the norm from a measurement to all reference measurements
 
     :param measurement: A Dataframe containing headers 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id'
-    :param reference: A Dataframe containing headers 'position', 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id per reference position'
+    :param reference: A Dataframe containing headers 'position', 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id per reference position' - or an already built Fingerprint
     :param metric: Desired norm, chebyshev or euclid (enum)
     :returns: (rssi_vector_norm, mcpd_vector_norm), both dictionaries with refernce position as index
 
     """
-    rssi_vector_norm = dict()
-    mcpd_vector_norm = dict()
+    if not isinstance(reference, Fingerprint):
+        reference = Fingerprint.from_dataframe(reference)
 
     # Create dictionary from measurement dataframe
     rssi_m = dict(zip(measurement["id"], measurement["rssi"]))
     mcpd_m = dict(zip(measurement["id"], measurement["mcpd_ifft"]))
 
-    # For each reference positin
-    for i in reference["position"].unique():
-        rssi_vector_diff = []
-        mcpd_vector_diff = []
-        # Create dictionary from rssi
-        rssi_r = reference[reference["position"] == i][["id", "rssi"]]
-        rssi_r = dict(zip(rssi_r["id"], rssi_r["rssi"]))
-        # Create dictionary from mcpd
-        mcpd_r = reference[reference["position"] == i][["id", "mcpd_ifft"]]
-        mcpd_r = dict(zip(mcpd_r["id"], mcpd_r["mcpd_ifft"]))
-
-        # For each beacon in the room, calculate the vector difference between measurement and reference
-        for b in beacons:
-            rssi_vector_diff.append(rssi_m[b.n] - rssi_r[b.n])
-            mcpd_vector_diff.append(mcpd_m[b.n] - mcpd_r[b.n])
-
-        # Compute the vector norm
-        rssi_vector_norm[i] = norm(rssi_vector_diff, ord=metric.value)
-        mcpd_vector_norm[i] = norm(mcpd_vector_diff, ord=metric.value)
+    # Compute the vector norm to all reference positions in one go
+    (rssi, mcpd) = reference.norm(
+        [rssi_m[b.n] for b in beacons],
+        [mcpd_m[b.n] for b in beacons],
+        beacons,
+        metric,
+    )
 
     # Return the vector norm
+    rssi_vector_norm = dict(zip(reference.positions.tolist(), rssi.tolist()))
+    mcpd_vector_norm = dict(zip(reference.positions.tolist(), mcpd.tolist()))
     return (rssi_vector_norm, mcpd_vector_norm)
 
 
-def compute_estimation(closest: Dict[int, float]) -> Point:
+def compute_estimation(closest: Dict[int, float], train_points: Dict[int, Point] = None) -> Point:
     """Using the k closest neighbors, computes the weighted kNN estimation
 
     :param closest: dictionary containing closest point as key and the corresponding distance as value
+    :param train_points: Dict[position] = Point, the coordinates of the reference positions, defaults to the train points of configs.site
     :returns: a single Point, the result of the computation
 
     """
+    train_points = train_points or configs.site.train_points
     # Get k closest references
-    references = {key: configs.room.train_points[key] for key in closest}
+    references = {key: train_points[key] for key in closest}
     sum_w_i = 1 / sum([1 / x for x in closest.values()])
     estimate = sum_w_i * sum([(1 / closest[i]) * references[i] for i in closest.keys()])
     return estimate
 
 
-def get_estimation_point(k: int, point: int, beacons, metric: Metric, measurement):
+def get_ground_truth(point: int) -> Point:
+    """Looks up the ground truth position of a train or validation point
+
+    :param point: integer, pointing to the number of the measurement position
+    :returns: Point
+
+    """
+    if point in configs.site.validation_points:
+        return configs.site.validation_points[point]
+    elif point in configs.site.train_points:
+        return configs.site.train_points[point]
+    else:
+        raise ValueError("Point {} does not exist".format(point))
+
+
+def reference_coordinates(reference: Fingerprint) -> np.ndarray:
+    """Coordinates of the reference positions of a fingerprint, looked up in configs.site if it does not carry them
+
+    :returns: array (positions x 2)
+
+    """
+    if reference.coordinates is not None:
+        return reference.coordinates
+    return np.array([[configs.site.train_points[p].x, configs.site.train_points[p].y] for p in reference.positions.tolist()]).reshape(-1, 2)
+
+
+def compute_estimation_batch(coordinates, closest, distances):
+    """Vectorized counterpart of compute_estimation for N sets of k closest neighbors
+
+    :param coordinates: array (positions x 2) holding the coordinates of the reference positions
+    :param closest: array (N x k) of row indices into coordinates
+    :param distances: array (N x k) of the corresponding distances
+    :returns: array (N x 2) of estimated positions, the reference position itself for a distance of 0
+
+    """
+    w = 1 / np.fmax(distances, MIN_DISTANCE)
+    return np.einsum("nk,nkd->nd", w, coordinates[closest]) / w.sum(axis=-1, keepdims=True)
+
+
+def fuse_distances(rssi_dist, mcpd_dist, alpha: float = 0.5):
+    """Weighted sum of the RSSI and MCPD distances, each normalized by its median over the reference positions
+
+    :param rssi_dist: array (N x positions) of RSSI distances
+    :param mcpd_dist: array (N x positions) of MCPD distances
+    :param alpha: weight of RSSI, MCPD is weighted by 1 - alpha
+    :returns: array (N x positions)
+
+    """
+    rssi_scale = np.median(rssi_dist, axis=-1, keepdims=True)
+    mcpd_scale = np.median(mcpd_dist, axis=-1, keepdims=True)
+    # A median of 0 (at least half the distances are 0) leaves the distances unscaled
+    rssi_scale = np.where(rssi_scale > 0, rssi_scale, 1)
+    mcpd_scale = np.where(mcpd_scale > 0, mcpd_scale, 1)
+    return alpha * rssi_dist / rssi_scale + (1 - alpha) * mcpd_dist / mcpd_scale
+
+
+def gate_distances(rssi_dist, mcpd_dist, gate: int):
+    """Keeps the RSSI distances of the gate reference positions closest in MCPD, all others become infinite
+
+    :param rssi_dist: array (N x positions) of RSSI distances
+    :param mcpd_dist: array (N x positions) of MCPD distances
+    :param gate: number of reference positions passing the MCPD gate
+    :returns: array (N x positions)
+
+    """
+    (candidates, _) = k_nearest(mcpd_dist, gate)
+    gated = np.full_like(rssi_dist, np.inf)
+    np.put_along_axis(gated, candidates, np.take_along_axis(rssi_dist, candidates, axis=-1), axis=-1)
+    return gated
+
+
+def measurement_vectors(measurement, beacons):
+    """Brings a measurement into the order of beacons
+
+    :param measurement: A Dataframe containing headers 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id' - or an array (beacons x [rssi, mcpd_ifft])
+    :returns: (rssi, mcpd), one value per beacon
+
+    """
+    if isinstance(measurement, np.ndarray):
+        return (measurement[:, 0], measurement[:, 1])
+    rssi_m = dict(zip(measurement["id"], measurement["rssi"]))
+    mcpd_m = dict(zip(measurement["id"], measurement["mcpd_ifft"]))
+    return ([rssi_m[b.n] for b in beacons], [mcpd_m[b.n] for b in beacons])
+
+
+def k_closest(reference: Fingerprint, k: int, beacons, metric: Metric, rssi, mcpd, backend: str = "auto", cache: DistanceCache = None, key=None, search_options: Dict = None):
+    """Finds the k closest reference positions for RSSI and MCPD, from the cache if one is given
+
+    :returns: (rssi_idx, rssi_dist, mcpd_idx, mcpd_dist), arrays (N x k) - indices are rows of the fingerprint matrices
+
+    """
+    if cache is not None and key is not None:
+        (rssi_norm, mcpd_norm) = cache.distances(key, beacons, metric, rssi, mcpd)
+        return (*k_nearest(np.atleast_2d(rssi_norm), k), *k_nearest(np.atleast_2d(mcpd_norm), k))
+    return (
+        *reference.search("rssi", rssi, beacons, metric, k, backend, **(search_options or {})),
+        *reference.search("mcpd", mcpd, beacons, metric, k, backend, **(search_options or {})),
+    )
+
+
+def get_estimation_point(k: int, point: int, beacons, metric: Metric, measurement, store: ReferenceStore = None, backend: str = "auto", cache: DistanceCache = None, key=None, search_options: Dict = None):
     """Computes a result for MCPD and RSSI for a given ground-truth point and a given measurement
 
     :param k: k-closest Neighbors
     :param point: integer, pointing to the number of the measurement position
     :param metric: Chebyshev or Euclidian norm for computation
-    :param measurement: A Dataframe containing headers 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id'
+    :param measurement: A Dataframe containing headers 'id', 'rssi', 'mcpd_ifft' - and exactly one row per beacon/id' - or an array (beacons x [rssi, mcpd_ifft]) in the order of beacons
+    :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+    :param backend: neighbor search backend ("brute", "kd_tree", "ball_tree", "clustered"), "auto" chooses by the size of the reference data
+    :param cache: DistanceCache to take the distances from, used together with key (instead of backend)
+    :param key: identity of the measurement in the cache
+    :param search_options: options of the backend, e.g. {"clusters": 100, "probes": 5} for "clustered"
     :returns: Result, containing all informations needed
 
     """
     # Get the average reference trainings data of all positions
-    reference = pd.read_csv("{}results_avg.csv".format(configs.train_set_path))[
-        ["position", "id", "rssi", "mcpd_ifft"]
-    ]
+    reference = cache.reference if cache is not None else _store(store).fingerprint()
 
     # Get ground truth position "ref_point" of desired point
-    if point in configs.room.validation_points:
-        ref_point = configs.room.validation_points[point]
-    elif point in configs.room.train_points:
-        ref_point = configs.room.train_points[point]
-    else:
-        raise ValueError("Point {} does not exist".format(point))
+    ref_point = get_ground_truth(point)
 
-    # Get norm distances between the trainings data and the measurement for all trainings points
-    (rssi, mcpd) = get_norm(measurement, reference, beacons, metric)
+    # Get measurement vectors in the order of beacons
+    (rssi_m, mcpd_m) = measurement_vectors(measurement, beacons)
 
-    ### As insertion order is preserved: sort them by value to get k closest neighbors:
-    # Get index
-    rssi_k_closest = list(dict(sorted(rssi.items(), key=lambda item: item[1])))[0:k]
-    mcpd_k_closest = list(dict(sorted(mcpd.items(), key=lambda item: item[1])))[0:k]
+    # Search the k closest trainings points, ordered by distance
+    (rssi_idx, rssi_dist, mcpd_idx, mcpd_dist) = k_closest(reference, k, beacons, metric, rssi_m, mcpd_m, backend, cache, key, search_options)
 
     # Get dictionary out of it
-    rssi_k_closest = {key: rssi[key] for key in rssi_k_closest}
-    mcpd_k_closest = {key: mcpd[key] for key in mcpd_k_closest}
+    rssi_k_closest = dict(zip(reference.positions[rssi_idx[0]].tolist(), rssi_dist[0].tolist()))
+    mcpd_k_closest = dict(zip(reference.positions[mcpd_idx[0]].tolist(), mcpd_dist[0].tolist()))
 
     # Estimate position, using the set of k closest neighbors
     rssi_estimation = compute_estimation(rssi_k_closest)
@@ -183,28 +418,120 @@ def get_estimation_point(k: int, point: int, beacons, metric: Metric, measuremen
         mcpd_euc_error=mcpd_error,
     )
 
-def get_estimation_point_from_average(k: int, point: int, beacons, metric: Metric):
+def get_estimation_batch(k: int, points, beacons, metric: Metric, rssi, mcpd, reference=None, store: ReferenceStore = None, backend: str = "auto", cache: DistanceCache = None, key=None, search_options: Dict = None) -> BatchResult:
+    """Computes results for MCPD and RSSI for N measurements at once
+
+    :param k: k-closest Neighbors
+    :param points: N integers, pointing to the number of the measurement position of each measurement (or a single one for all)
+    :param beacons: List of Beacon, defining the columns of rssi and mcpd
+    :param metric: Chebyshev or Euclidian norm for computation
+    :param rssi: array (N x beacons) of RSSI measurements
+    :param mcpd: array (N x beacons) of MCPD measurements
+    :param reference: Fingerprint (or reference Dataframe) to compare against, defaults to the average trainings data
+    :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+    :param backend: neighbor search backend ("brute", "kd_tree", "ball_tree", "clustered"), "auto" chooses by the size of the reference data
+    :param cache: DistanceCache to take the distances from, used together with key (instead of reference and backend)
+    :param key: identity of the measurements in the cache
+    :param search_options: options of the backend, e.g. {"clusters": 100, "probes": 5} for "clustered"
+    :returns: BatchResult, containing all informations needed
+
+    """
+    if cache is not None:
+        reference = cache.reference
+    elif reference is None:
+        reference = _store(store).fingerprint()
+    if not isinstance(reference, Fingerprint):
+        reference = Fingerprint.from_dataframe(reference)
+    rssi = np.atleast_2d(np.asarray(rssi, dtype=float))
+    mcpd = np.atleast_2d(np.asarray(mcpd, dtype=float))
+    points = np.broadcast_to(np.asarray(points), (rssi.shape[0],))
+
+    # Ground truth and reference coordinates as arrays
+    truth = {p: get_ground_truth(p) for p in np.unique(points).tolist()}
+    position = np.array([[truth[p].x, truth[p].y] for p in points.tolist()]).reshape(-1, 2)
+    coordinates = reference_coordinates(reference)
+
+    # Search the k closest reference positions of all measurements
+    (rssi_idx, rssi_dist, mcpd_idx, mcpd_dist) = k_closest(reference, k, beacons, metric, rssi, mcpd, backend, cache, key, search_options)
+
+    # Estimate positions and errors
+    rssi_estimation = compute_estimation_batch(coordinates, rssi_idx, rssi_dist)
+    mcpd_estimation = compute_estimation_batch(coordinates, mcpd_idx, mcpd_dist)
+
+    return BatchResult(
+        idx=points.copy(),
+        metric=metric,
+        k=k,
+        position=position,
+        rssi_estimation=rssi_estimation,
+        mcpd_estimation=mcpd_estimation,
+        rssi_euc_error=np.hypot(*(rssi_estimation - position).T),
+        mcpd_euc_error=np.hypot(*(mcpd_estimation - position).T),
+        rssi_k_closest=reference.positions[rssi_idx],
+        mcpd_k_closest=reference.positions[mcpd_idx],
+        rssi_k_distance=rssi_dist,
+        mcpd_k_distance=mcpd_dist,
+    )
+
+def get_estimation_point_from_average(k: int, point: int, beacons, metric: Metric, store: ReferenceStore = None, cache: DistanceCache = None):
     """Computes a result for MCPD and RSSI for a given ground-truth point
     :param k: k-closest Neighbors
     :param point: integer, pointing to the number of the measurement position
     :param metric: Chebyshev or Euclidian norm for computation
+    :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+    :param cache: DistanceCache to reuse the distances of the average measurement, e.g. across k
     :returns: Result, containing all informations needed
 
     """
-    # Get the average test data of all positions
-    test = pd.read_csv("{}results_avg.csv".format(configs.test_set_path))[
-        ["position", "id", "rssi", "mcpd_ifft"]
-    ]
-    # Get the average validation data of all positions
-    validation = pd.read_csv("{}results_avg.csv".format(configs.validation_set_path))[
-        ["position", "id", "rssi", "mcpd_ifft"]
-    ]
-
-    # Get measurement of desired point and the ground truth position "ref_point"
-    if point in configs.room.validation_points:
-        measurement = validation[validation["position"] == point]
-    elif point in configs.room.train_points:
-        measurement = test[test["position"] == point]
-    else:
-        raise ValueError("Point {} does not exist".format(point))
-    return get_estimation_point(k, point, beacons, metric, measurement)
+    store = _store(store)
+    # Get the average test or validation measurement of desired point
+    measurement = store.measurement(point)
+    return get_estimation_point(k, point, beacons, metric, measurement, store, cache=cache, key=("average", point))
+
+
+def get_estimation_fused(k: int, points, beacons, metric: Metric, measurement, alpha: float = 0.5, gate: int = None, reference=None, store: ReferenceStore = None) -> FusedBatchResult:
+    """Computes results for MCPD, RSSI and their combinations for N measurements, with one pass over the stacked fingerprints
+
+    :param k: k-closest Neighbors
+    :param points: N integers, pointing to the number of the measurement position of each measurement (or a single one for all)
+    :param beacons: List of Beacon, defining the columns of measurement
+    :param metric: Chebyshev, Euclidian or variance-weighted norm for computation
+    :param measurement: array (N x beacons x [rssi, mcpd_ifft]) of measurements
+    :param alpha: weight of RSSI in the fused distance, MCPD is weighted by 1 - alpha
+    :param gate: number of MCPD-closest reference positions the gated estimator chooses from, defaults to 2k
+    :param reference: Fingerprint (or reference Dataframe) to compare against, defaults to the average trainings data
+    :param store: ReferenceStore holding the reference data, defaults to reference_store.default_store
+    :returns: FusedBatchResult, containing all informations needed
+
+    """
+    if reference is None:
+        reference = _store(store).fingerprint()
+    if not isinstance(reference, Fingerprint):
+        reference = Fingerprint.from_dataframe(reference)
+    measurement = np.asarray(measurement, dtype=float).reshape(-1, len(beacons), 2)
+    points = np.broadcast_to(np.asarray(points), (measurement.shape[0],))
+    gate = max(gate or 2 * k, k)
+
+    # Ground truth and reference coordinates as arrays
+    truth = {p: get_ground_truth(p) for p in np.unique(points).tolist()}
+    position = np.array([[truth[p].x, truth[p].y] for p in points.tolist()]).reshape(-1, 2)
+    coordinates = reference_coordinates(reference)
+
+    # Distances of both modalities in one pass, then the k closest for each estimator
+    distances = reference.fused_norm(measurement, beacons, metric)
+    (rssi_dist, mcpd_dist) = (distances[..., 0], distances[..., 1])
+    closest = {
+        "rssi": k_nearest(rssi_dist, k),
+        "mcpd": k_nearest(mcpd_dist, k),
+        "fused": k_nearest(fuse_distances(rssi_dist, mcpd_dist, alpha), k),
+        "gated": k_nearest(gate_distances(rssi_dist, mcpd_dist, gate), k),
+    }
+    fields = {}
+    for name, (idx, dist) in closest.items():
+        estimation = compute_estimation_batch(coordinates, idx, dist)
+        fields["{}_estimation".format(name)] = estimation
+        fields["{}_euc_error".format(name)] = np.hypot(*(estimation - position).T)
+        fields["{}_k_closest".format(name)] = reference.positions[idx]
+        fields["{}_k_distance".format(name)] = dist
+
+    return FusedBatchResult(idx=points.copy(), metric=metric, k=k, position=position, **fields)